@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark the bezier flattener on a single subpath of N cubic curves.
+
+usage: bench_flatten.py [--legacy-max N] [sizes...]
+
+The old list-splicing flattener is quadratic, so it is only timed up to
+--legacy-max curves. The NumPy batch flattener is timed when NumPy is
+installed.
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib import bezmisc
+from lib import ffgeom
+
+from svg2g import flatten
+
+def make_path(n):
+    """
+    Build a CubicSuperPath subpath of [n] smooth, gently curving cubics.
+    """
+    rand = random.Random(n)
+    path = [[[0.0, 0.0], [0.0, 0.0], [1.0, 1.0]]]
+
+    for i in range(1, n + 1):
+        x = i * 4.0
+        y = rand.uniform(-2.0, 2.0)
+        path.append([[x - 1.0, y - 1.0], [x, y], [x + 1.0, y + 1.0]])
+
+    return path
+
+def legacy_subdivide(cubic_bezier_path, flat):
+    """
+    The original in-place flattener, kept for comparison.
+    """
+    def max_distance(points):
+        ((p0x, p0y), (p1x, p1y), (p2x, p2y), (p3x, p3y)) = points
+        s1 = ffgeom.Segment(ffgeom.Point(p0x, p0y), ffgeom.Point(p3x, p3y))
+
+        return max(s1.distanceToPoint(ffgeom.Point(p1x, p1y)), s1.distanceToPoint(ffgeom.Point(p2x, p2y)))
+
+    i = 1
+
+    while True:
+        while True:
+            if i >= len(cubic_bezier_path):
+                return [p[1] for p in cubic_bezier_path]
+
+            b = (cubic_bezier_path[i - 1][1], cubic_bezier_path[i - 1][2], cubic_bezier_path[i][0], cubic_bezier_path[i][1])
+
+            if max_distance(b) > flat:
+                break
+
+            i += 1
+
+        one, two = bezmisc.beziersplitatt(b, 0.5)
+        cubic_bezier_path[i - 1][2] = one[1]
+        cubic_bezier_path[i][0] = two[2]
+        cubic_bezier_path[i:1] = [[one[2], one[3], two[1]]]
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+
+    return time.time() - start, result
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options] [sizes...]')
+    parser.add_option('--flat', type='float', default=0.01, help='Flatness tolerance')
+    parser.add_option('--legacy-max', type='int', default=10000, help='Largest size to run the legacy flattener on')
+    options, args = parser.parse_args()
+
+    sizes = [int(a) for a in args] or [1000, 10000, 100000, 1000000]
+
+    sys.stdout.write('%10s %12s %12s %14s %12s %12s\n' % ('curves', 'points', 'linear (s)', 'us/point', 'legacy (s)', 'numpy (s)'))
+
+    for n in sizes:
+        path = make_path(n)
+
+        elapsed, points = timed(flatten.flatten_cubic_superpath, path, options.flat)
+
+        if n <= options.legacy_max:
+            legacy_elapsed, legacy_points = timed(legacy_subdivide, make_path(n), options.flat)
+            assert legacy_points == points
+            legacy = '%12.3f' % legacy_elapsed
+        else:
+            legacy = '%12s' % '-'
+
+        if flatten.numpy is not None:
+            batch = '%12.3f' % timed(flatten.flatten_batch, [[path]], options.flat)[0]
+        else:
+            batch = '%12s' % '-'
+
+        sys.stdout.write('%10i %12i %12.3f %14.3f %s %s\n' % (n, len(points), elapsed, elapsed * 1e6 / len(points), legacy, batch))
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark GCode emission for polylines, comparing the per-point
+draw_to_point() loop with GCodeBuilder.draw_points().
+
+usage: bench_gcode.py [--points N] [--length N]
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from svg2g.gcode import GCodeBuilder
+
+OPTIONS = {
+    'x_offset': 64.0,
+    'paper_length': 100.0,
+    'start_delay': 150.0,
+    'stop_delay': 150.0,
+    'xy_feedrate': 3500.0,
+    'homing_feedrate': 1000.0,
+    'x_home': 0.0,
+    'y_home': 0.0,
+    'z_home': 0.0
+}
+
+def make_polylines(count, length):
+    """
+    Random walks, with some repeated points, as lists and tuples like the
+    flattener produces.
+    """
+    rand = random.Random(count)
+    polylines = []
+
+    for i in range(count // length):
+        x, y = rand.uniform(0, 200), rand.uniform(0, 200)
+        points = []
+
+        for j in range(length):
+            if rand.random() > 0.05:
+                x += rand.uniform(-1, 1)
+                y += rand.uniform(-1, 1)
+
+            points.append((x, y) if rand.random() > 0.5 else [x, y])
+
+        polylines.append(points)
+
+    return polylines
+
+def per_point(gcode, points):
+    start = points[0]
+
+    gcode.go_to_point(start[0], start[1])
+    gcode.start()
+
+    for point in points[1:]:
+        gcode.draw_to_point(point[0], point[1])
+        gcode.last = point
+
+    gcode.stop()
+
+def emit(draw, polylines):
+    gcode = GCodeBuilder(optparse.Values(OPTIONS))
+    start = time.time()
+
+    for points in polylines:
+        draw(gcode, points)
+
+    output = gcode.build()
+
+    return time.time() - start, output
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--points', type='int', default=1000000, help='Total number of points')
+    parser.add_option('--length', type='int', default=1000, help='Points per polyline')
+    options, args = parser.parse_args()
+
+    polylines = make_polylines(options.points, options.length)
+
+    loop_elapsed, loop_output = emit(per_point, polylines)
+    bulk_elapsed, bulk_output = emit(GCodeBuilder.draw_polyline, polylines)
+
+    assert loop_output == bulk_output
+
+    sys.stdout.write('%i points: per point %0.3fs, bulk %0.3fs, %i bytes\n' % (options.points, loop_elapsed, bulk_elapsed, len(bulk_output)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark incremental conversion, and check that it is exact: for every
+flatten backend, a full conversion and two incremental ones (the first
+filling the fragment cache, the second reading it) must give the same
+GCode, and so must a full and an incremental conversion of the document
+once some of its elements have been edited.
+
+usage: bench_incremental.py [--motifs N] [--clones N]
+"""
+
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from svg2g import api
+from svg2g import flatten
+from svg2g.cache import FragmentCache
+from svg2g.options import Options
+
+def make_document(motifs, clones, edited=False):
+    """
+    A document of curved motifs, each drawn once and cloned with a mix
+    of repeated and distinct transforms, so that identical elements are
+    flattened both in full and from the geometry cache. If [edited], one
+    motif in ten is reshaped and one clone in five moved or rescaled.
+    """
+    rand = random.Random(motifs)
+    transforms = ['', 'rotate(30)', 'scale(1.7)', 'translate(5,5)', 'matrix(1,0.3,0,1,0,0)']
+    data = ['<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="200" height="150">']
+
+    for i in range(motifs):
+        points = ' '.join('%.3f,%.3f' % (rand.uniform(0, 100), rand.uniform(0, 100)) for j in range(6))
+
+        if edited and i % 10 == 0:
+            points = points.replace(',', ',1', 1)
+
+        data.append('<path id="m%i" d="M 10,10 C %s a 5 3 20 0 1 10 10 Z"/>' % (i, points))
+
+        for j in range(clones):
+            transform = rand.choice(transforms)
+
+            if edited and j % 5 == 0:
+                transform += ' scale(%.2f)' % (0.5 + (i + j) % 7 * 0.25)
+
+            data.append('<use xlink:href="#m%i" transform="%s"/>' % (i, transform))
+
+    data.append('</svg>')
+
+    return '\n'.join(data).encode('utf-8')
+
+def measure(options, source, fragment_cache=None):
+    # A new converter each time, as its geometry cache would otherwise
+    # be warm from the previous conversion
+    converter = api.Converter(options)
+    start = time.time()
+    output = b''.join(converter.convert(source, fragment_cache))
+
+    return time.time() - start, output
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--motifs', type='int', default=200, help='Number of distinct paths')
+    parser.add_option('--clones', type='int', default=10, help='Number of clones of each path')
+    options, args = parser.parse_args()
+
+    source = make_document(options.motifs, options.clones)
+    edited = make_document(options.motifs, options.clones, edited=True)
+    directory = tempfile.mkdtemp()
+    backends = ['python'] + (['numpy'] if flatten.numpy is not None else [])
+    differ = False
+
+    try:
+        for backend in backends:
+            conversion_options = Options(scaling=0.2646, flatten_backend=backend)
+            path = os.path.join(directory, backend + '.pickle')
+
+            full_elapsed, full = measure(conversion_options, source)
+            first_elapsed, first = measure(conversion_options, source, FragmentCache(path))
+            second_elapsed, second = measure(conversion_options, source, FragmentCache(path))
+            edited_full_elapsed, edited_full = measure(conversion_options, edited)
+            edited_elapsed, edited_incremental = measure(conversion_options, edited, FragmentCache(path))
+
+            if not (full == first == second):
+                sys.stdout.write('%s: results differ\n' % backend)
+                differ = True
+
+            if edited_full != edited_incremental:
+                sys.stdout.write('%s: results differ after the edit\n' % backend)
+                differ = True
+
+            sys.stdout.write('%s: full %0.3fs, first incremental %0.3fs, second incremental %0.3fs\n' % (backend, full_elapsed, first_elapsed, second_elapsed))
+            sys.stdout.write('%s after the edit: full %0.3fs, incremental %0.3fs\n' % (backend, edited_full_elapsed, edited_elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+    if differ:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
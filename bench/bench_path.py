@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Benchmark parsing path data, comparing the original token by token
+parsePath with the current one.
+
+usage: bench_path.py [--segments N] [--paths N]
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib import simplepath
+
+def make_data(segments, seed):
+    """
+    Path data as written by editors: a moveto, then mostly relative
+    curves and lines, some with repeated parameters.
+    """
+    rand = random.Random(seed)
+    data = ['M %f,%f' % (rand.uniform(0, 100), rand.uniform(0, 100))]
+
+    for i in range(segments):
+        command = rand.choice('cclLhvsqz')
+        count = simplepath.pathdefs[command.upper()][1]
+        data.append(command + ' '.join(['%.3f' % rand.uniform(-10, 10) for j in range(count)]))
+
+    return ' '.join(data)
+
+def legacy_parse_path(d):
+    """
+    The original parsePath, lexing one token at a time, kept for
+    comparison.
+    """
+    pathdefs = simplepath.pathdefs
+    retval = []
+    lexer = simplepath.lexPath(d)
+
+    pen = (0.0,0.0)
+    subPathStart = pen
+    lastControl = pen
+    lastCommand = ''
+
+    for token, isCommand in lexer:
+        params = []
+        needParam = True
+        if isCommand:
+            command = token
+        else:
+            needParam = False
+            if lastCommand.isupper():
+                command = pathdefs[lastCommand][0]
+            else:
+                command = pathdefs[lastCommand.upper()][0].lower()
+        numParams = pathdefs[command.upper()][1]
+        while numParams > 0:
+            if needParam:
+                token, isCommand = lexer.next()
+            cast = pathdefs[command.upper()][2][-numParams]
+            param = cast(token)
+            if command.islower():
+                if pathdefs[command.upper()][3][-numParams]=='x':
+                    param += pen[0]
+                elif pathdefs[command.upper()][3][-numParams]=='y':
+                    param += pen[1]
+            params.append(param)
+            needParam = True
+            numParams -= 1
+        outputCommand = command.upper()
+
+        if outputCommand in ('H','V'):
+            if outputCommand == 'H':
+                params.append(pen[1])
+            if outputCommand == 'V':
+                params.insert(0,pen[0])
+            outputCommand = 'L'
+        if outputCommand in ('S','T'):
+            params.insert(0,pen[1]+(pen[1]-lastControl[1]))
+            params.insert(0,pen[0]+(pen[0]-lastControl[0]))
+            if outputCommand == 'S':
+                outputCommand = 'C'
+            if outputCommand == 'T':
+                outputCommand = 'Q'
+
+        if outputCommand == 'M':
+            subPathStart = tuple(params[0:2])
+            pen = subPathStart
+        if outputCommand == 'Z':
+            pen = subPathStart
+        else:
+            pen = tuple(params[-2:])
+
+        if outputCommand in ('Q','C'):
+            lastControl = tuple(params[-4:-2])
+        else:
+            lastControl = pen
+        lastCommand = command
+
+        retval.append([outputCommand,params])
+    return retval
+
+def measure(parse, paths):
+    start = time.time()
+
+    for d in paths:
+        result = parse(d)
+
+    return time.time() - start, result
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--segments', type='int', default=2000, help='Number of segments per path')
+    parser.add_option('--paths', type='int', default=100, help='Number of paths')
+    options, args = parser.parse_args()
+
+    paths = [make_data(options.segments, i) for i in range(options.paths)]
+
+    old_elapsed, old_result = measure(legacy_parse_path, paths)
+    new_elapsed, new_result = measure(simplepath.parsePath, paths)
+
+    if old_result != new_result:
+        sys.stdout.write('results differ\n')
+
+    sys.stdout.write('%i paths of %i segments: legacy %0.3fs, parsePath %0.3fs\n' % (options.paths, options.segments, old_elapsed, new_elapsed))
+
+if __name__ == '__main__':
+    main()
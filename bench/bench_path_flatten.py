@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Benchmark turning path data into output polylines, comparing the three
+pass pipeline (CubicSuperPath, transform, flatten) with the fused
+flatten.flatten_path. Both produce a Polylines buffer. Each engine runs
+in its own process, so peak memory is reported separately.
+
+usage: bench_path_flatten.py [--segments N] [--flat F]
+"""
+
+import optparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib import cubicsuperpath
+from lib import simplepath
+
+from svg2g import flatten
+from svg2g import transform
+from svg2g.geometry import Polylines
+
+def make_data(segments):
+    """
+    Path data for one long path: mostly relative lines and curves, with
+    a few arcs.
+    """
+    rand = random.Random(segments)
+    data = ['M 0,0']
+
+    for i in range(segments):
+        command = rand.choice('llllccsqa')
+
+        if command == 'a':
+            data.append('a 5 3 %i 0 1 %.3f %.3f' % (rand.randint(0, 90), rand.uniform(-10, 10), rand.uniform(-10, 10)))
+        else:
+            count = simplepath.pathdefs[command.upper()][1]
+            data.append(command + ' '.join(['%.3f' % rand.uniform(-10, 10) for j in range(count)]))
+
+    return ' '.join(data)
+
+def run_pipeline(d, m, flat):
+    path = cubicsuperpath.CubicSuperPath(simplepath.parsePath(d))
+    transform.apply_to_path(m, path)
+
+    return Polylines(flatten.flatten_cubic_superpath(subpath, flat) for subpath in path)
+
+def run_fused(d, m, flat):
+    return flatten.flatten_path(simplepath.parsePath(d), m, flat)
+
+def measure(engine, segments, flat):
+    d = make_data(segments)
+    m = (0.2646, 0.0, 0.0, -0.2646, 0, 100.0)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.time()
+    polylines = engine(d, m, flat)
+    elapsed = time.time() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    points = polylines.point_count()
+
+    sys.stdout.write('%s %0.3f %i %i\n' % (engine.__name__, elapsed, peak, points))
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--segments', type='int', default=200000, help='Number of segments in the path')
+    parser.add_option('--flat', type='float', default=0.01, help='Flatness tolerance')
+    parser.add_option('--engine', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args()
+
+    if options.engine:
+        measure(globals()[options.engine], options.segments, options.flat)
+        return
+
+    for engine in ('run_pipeline', 'run_fused'):
+        output = subprocess.check_output([sys.executable, __file__, '--engine', engine,
+            '--segments', str(options.segments), '--flat', str(options.flat)])
+        name, elapsed, peak, points = output.split()
+
+        sys.stdout.write('%s: %ss, peak +%i kB, %s points\n' % (name, elapsed, int(peak), points))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Benchmark resolving node transforms and transforming paths, comparing
+simpletransform with svg2g.transform.
+
+usage: bench_transform.py [--nodes N] [--points N]
+"""
+
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from lib import simpletransform
+
+from svg2g import transform
+
+def make_attributes(count):
+    """
+    Transform attributes as found on the nodes of a drawing: mostly
+    absent, with a few distinct values repeated.
+    """
+    rand = random.Random(count)
+    values = ['translate(%i,%i)' % (i, 2 * i) for i in range(20)] + ['rotate(%i 10 10)' % i for i in range(20)]
+
+    return [rand.choice(values) if rand.random() < 0.3 else None for i in range(count)]
+
+def make_path(count):
+    rand = random.Random(count)
+
+    return [[[[rand.uniform(0, 100), rand.uniform(0, 100)] for k in range(3)] for j in range(count // 3)]]
+
+def resolve_simpletransform(attributes, paths):
+    current = [[0.2646, 0.0, 0], [0.0, -0.2646, 100.0]]
+
+    for attribute in attributes:
+        simpletransform.composeTransform(current, simpletransform.parseTransform(attribute))
+
+    for path in paths:
+        simpletransform.applyTransformToPath(current, path)
+
+def resolve_transform(attributes, paths):
+    current = (0.2646, 0.0, 0.0, -0.2646, 0, 100.0)
+
+    for attribute in attributes:
+        transform.compose(current, transform.parse(attribute))
+
+    for path in paths:
+        transform.apply_to_path(current, path)
+
+def measure(resolve, attributes, paths):
+    start = time.time()
+    resolve(attributes, paths)
+
+    return time.time() - start
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options]')
+    parser.add_option('--nodes', type='int', default=200000, help='Number of nodes')
+    parser.add_option('--points', type='int', default=300000, help='Number of path points')
+    options, args = parser.parse_args()
+
+    attributes = make_attributes(options.nodes)
+
+    old_elapsed = measure(resolve_simpletransform, attributes, [make_path(options.points)])
+    new_elapsed = measure(resolve_transform, attributes, [make_path(options.points)])
+
+    sys.stdout.write('%i nodes, %i points: simpletransform %0.3fs, transform %0.3fs\n' % (options.nodes, options.points, old_elapsed, new_elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,15 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 import re, math
 
+# Path data tokens, compiled once
+delimiters = ' \t\r\n,'
+delimiterPattern = re.compile(r'[ \t\r\n,]+')
+commandPattern = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
+parameterPattern = re.compile(r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
+numberPattern = re.compile(r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+commandSplitPattern = re.compile(r'([MLHVCSQTAZmlhvcsqtaz])')
+invalidPattern = re.compile(r'[^MLHVCSQTAZmlhvcsqtaz \t\r\n,]')
+
 def lexPath(d):
     """
     returns and iterator that breaks path data 
@@ -29,9 +38,9 @@ def lexPath(d):
     """
     offset = 0
     length = len(d)
-    delim = re.compile(r'[ \t\r\n,]+')
-    command = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
-    parameter = re.compile(r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
+    delim = delimiterPattern
+    command = commandPattern
+    parameter = parameterPattern
     while 1:
         m = delim.match(d, offset)
         if m:
@@ -76,91 +85,136 @@ def parsePath(d):
     Parse SVG path and return an array of segments.
     Removes all shorthand notation.
     Converts coordinates to absolute.
+
+    The path data is split on its command letters, and the parameters
+    following each command are found and converted in one go rather than
+    lexed token by token.
     """
     retval = []
-    lexer = lexPath(d)
+    append = retval.append
+    parts = commandSplitPattern.split(d)
+
+    leading = parts[0].lstrip(delimiters)
+    if leading:
+        if numberPattern.match(leading):
+            raise Exception('Invalid path, no initial command.')
+        raise Exception('Invalid path data!')
+    if invalidPattern.search(numberPattern.sub('', d)):
+        raise Exception('Invalid path data!')
+
+    #pen, subpath start and last control point
+    px = py = sx = sy = cx = cy = 0.0
+
+    last = len(parts) - 2
+    for i in range(1, len(parts), 2):
+        command = parts[i]
+        tokens = numberPattern.findall(parts[i + 1])
+        if not retval and command not in 'Mm':
+            raise Exception('Invalid path, must begin with moveto.')
+
+        if command in 'Zz':
+            px, py = cx, cy = sx, sy
+            append(['Z',[]])
+            if not tokens:
+                continue
+            #parameters after closepath use its implicit next command
+            command = pathdefs['Z'][0] if command == 'Z' else pathdefs['Z'][0].lower()
 
-    pen = (0.0,0.0)
-    subPathStart = pen
-    lastControl = pen
-    lastCommand = ''
-    
-    while 1:
-        try:
-            token, isCommand = lexer.next()
-        except StopIteration:
-            break
-        params = []
-        needParam = True
-        if isCommand:
-            if not lastCommand and token.upper() != 'M':
-                raise Exception, 'Invalid path, must begin with moveto.'    
-            else:                
-                command = token
-        else:
-            #command was omited
-            #use last command's implicit next command
-            needParam = False
-            if lastCommand:
-                if lastCommand.isupper():
-                    command = pathdefs[lastCommand][0]
-                else:
-                    command = pathdefs[lastCommand.upper()][0].lower()
-            else:
-                raise Exception, 'Invalid path, no initial command.'    
-        numParams = pathdefs[command.upper()][1]
-        while numParams > 0:
-            if needParam:
-                try: 
-                    token, isCommand = lexer.next()
-                    if isCommand:
-                        raise Exception, 'Invalid number of parameters'
-                except StopIteration:
-                    raise Exception, 'Unexpected end of path'
-            cast = pathdefs[command.upper()][2][-numParams]
-            param = cast(token)
-            if command.islower():
-                if pathdefs[command.upper()][3][-numParams]=='x':
-                    param += pen[0]
-                elif pathdefs[command.upper()][3][-numParams]=='y':
-                    param += pen[1]
-            params.append(param)
-            needParam = True
-            numParams -= 1
-        #segment is now absolute so
         outputCommand = command.upper()
-    
-        #Flesh out shortcut notation    
-        if outputCommand in ('H','V'):
-            if outputCommand == 'H':
-                params.append(pen[1])
-            if outputCommand == 'V':
-                params.insert(0,pen[0])
-            outputCommand = 'L'
-        if outputCommand in ('S','T'):
-            params.insert(0,pen[1]+(pen[1]-lastControl[1]))
-            params.insert(0,pen[0]+(pen[0]-lastControl[0]))
-            if outputCommand == 'S':
-                outputCommand = 'C'
-            if outputCommand == 'T':
-                outputCommand = 'Q'
-
-        #current values become "last" values
-        if outputCommand == 'M':
-            subPathStart = tuple(params[0:2])
-            pen = subPathStart
-        if outputCommand == 'Z':
-            pen = subPathStart
-        else:
-            pen = tuple(params[-2:])
+        defs = pathdefs[outputCommand]
+        numParams = defs[1]
 
-        if outputCommand in ('Q','C'):
-            lastControl = tuple(params[-4:-2])
+        if outputCommand == 'A':
+            casts = defs[2]
+            values = [casts[j % numParams](token) for j, token in enumerate(tokens)]
         else:
-            lastControl = pen
-        lastCommand = command
+            values = map(float, tokens)
+        count = len(values)
+
+        if not count or count % numParams:
+            if i == last:
+                raise Exception('Unexpected end of path')
+            raise Exception('Invalid number of parameters')
 
-        retval.append([outputCommand,params])
+        relative = command.islower()
+
+        if outputCommand in ('M', 'L'):
+            for j in range(0, count, 2):
+                x, y = values[j:j + 2]
+                if relative:
+                    x += px
+                    y += py
+                if outputCommand == 'M':
+                    #further parameters after a moveto are linetos
+                    append(['M',[x, y]])
+                    sx, sy = x, y
+                    outputCommand = defs[0]
+                else:
+                    append(['L',[x, y]])
+                px, py = cx, cy = x, y
+        elif outputCommand == 'C':
+            for j in range(0, count, 6):
+                x1, y1, cx, cy, x, y = values[j:j + 6]
+                if relative:
+                    x1 += px
+                    y1 += py
+                    cx += px
+                    cy += py
+                    x += px
+                    y += py
+                append(['C',[x1, y1, cx, cy, x, y]])
+                px, py = x, y
+        elif outputCommand == 'S':
+            for j in range(0, count, 4):
+                x2, y2, x, y = values[j:j + 4]
+                if relative:
+                    x2 += px
+                    y2 += py
+                    x += px
+                    y += py
+                append(['C',[px+(px-cx), py+(py-cy), x2, y2, x, y]])
+                px, py, cx, cy = x, y, x2, y2
+        elif outputCommand == 'Q':
+            for j in range(0, count, 4):
+                cx, cy, x, y = values[j:j + 4]
+                if relative:
+                    cx += px
+                    cy += py
+                    x += px
+                    y += py
+                append(['Q',[cx, cy, x, y]])
+                px, py = x, y
+        elif outputCommand == 'T':
+            for j in range(0, count, 2):
+                x, y = values[j:j + 2]
+                if relative:
+                    x += px
+                    y += py
+                cx, cy = px+(px-cx), py+(py-cy)
+                append(['Q',[cx, cy, x, y]])
+                px, py = x, y
+        elif outputCommand == 'H':
+            for x in values:
+                if relative:
+                    x += px
+                append(['L',[x, py]])
+                px = cx = x
+                cy = py
+        elif outputCommand == 'V':
+            for y in values:
+                if relative:
+                    y += py
+                append(['L',[px, y]])
+                py = cy = y
+                cx = px
+        else:
+            for j in range(0, count, 7):
+                params = values[j:j + 7]
+                if relative:
+                    params[5] += px
+                    params[6] += py
+                append(['A',params])
+                px, py = cx, cy = params[5], params[6]
     return retval
 
 def formatPath(a):
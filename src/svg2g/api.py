@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+import io
+import multiprocessing
+
+from lxml import etree
+
+from svg2g.cache import GeometryCache
+from svg2g.gcode import GCodeBuilder
+from svg2g.optimize import PolylineJoiner, PolylineSimplifier, TravelOptimizer
+from svg2g.options import Options
+from svg2g.svg import SvgLayerChange, SvgParser, SvgPath, write_message
+
+class Converter(object):
+    """
+    Converts SVG documents to GCode with one set of options. Nothing is
+    global: a converter can be kept by a long-running process, and its
+    geometry cache stays warm from one document to the next. Warnings
+    and reports go to the [messages] file object given to convert().
+    """
+    # Number of GCode lines buffered before a chunk is yielded
+    chunk_size = 4096
+
+    def __init__(self, options=None):
+        if options is None:
+            options = Options()
+
+        self.options = options
+
+        if options.geometry_cache > 0:
+            self.geometry_cache = GeometryCache(options.geometry_cache)
+        else:
+            self.geometry_cache = None
+
+    def get_tolerance(self, messages=None):
+        """
+        Get the flattening tolerance, never finer than what the GCode
+        output can represent.
+        """
+        tolerance = self.options.tolerance
+
+        if tolerance is None:
+            return GCodeBuilder.resolution
+
+        if tolerance < GCodeBuilder.resolution:
+            write_message(messages, 'Warning: tolerance %g is below the output resolution, using %0.2f.' % (tolerance, GCodeBuilder.resolution))
+
+            return GCodeBuilder.resolution
+
+        return tolerance
+
+    def get_jobs(self):
+        """
+        Get the number of flattening processes.
+        """
+        if self.options.jobs <= 0:
+            return multiprocessing.cpu_count()
+
+        return self.options.jobs
+
+    def make_parser(self, svg, fragment_cache=None, stats=None, messages=None):
+        return SvgParser(svg, scale=self.options.scaling, tolerance=self.get_tolerance(messages), flatten_backend=self.options.flatten_backend, geometry_cache=self.geometry_cache, jobs=self.get_jobs(), fragment_cache=fragment_cache, stats=stats, messages=messages)
+
+    def iter_entities(self, source, fragment_cache=None, stats=None, messages=None):
+        """
+        Parse [source] (SVG bytes, a file object or an lxml tree or
+        element) and yield its entities.
+        """
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+
+        if hasattr(source, 'read'):
+            if self.options.stream_xml:
+                return self.make_parser(None, fragment_cache, stats, messages).iterparse_entities(source)
+
+            if stats is not None:
+                stats.start('parse_xml')
+
+            source = etree.parse(source, etree.XMLParser(huge_tree=True))
+
+            if stats is not None:
+                stats.stop()
+
+        if hasattr(source, 'getroot'):
+            source = source.getroot()
+
+        if not etree.iselement(source):
+            raise TypeError('cannot convert %r: expected SVG bytes, a file or an lxml tree' % type(source).__name__)
+
+        return self.make_parser(source, fragment_cache, stats, messages).iter_entities()
+
+    def process_svg_entity(self, gcode, svg_entity):
+        """
+        Generate GCode for a given SVG entity.
+        """
+
+        if isinstance(svg_entity, SvgPath):
+            len_segments = len(svg_entity.segments)
+
+            for i, points in enumerate(svg_entity.segments):
+                gcode.label('Polyline segment %i/%i' % (i + 1, len_segments))
+                gcode.draw_polyline(points)
+        elif isinstance(svg_entity, SvgLayerChange):
+            gcode.change_layer(svg_entity.layer_name)
+
+    def iter_chunks(self, gcode, entities, stats=None):
+        """
+        Generate the GCode for [entities] in chunks, then the footer.
+        """
+        for svg_entity in entities:
+            self.process_svg_entity(gcode, svg_entity)
+
+            if stats is not None and isinstance(svg_entity, SvgPath):
+                stats.count('points', svg_entity.segments.point_count())
+                stats.count('pen_lifts', len(svg_entity.segments))
+
+            if len(gcode.codes) >= self.chunk_size:
+                yield gcode.flush()
+
+        yield gcode.flush()
+
+        yield gcode.footer()
+
+    def convert(self, source, fragment_cache=None, stats=None, messages=None):
+        """
+        Convert [source] (SVG bytes, a file object or an lxml tree or
+        element), yielding the GCode in chunks while the SVG is being
+        parsed.
+
+        With a FragmentCache, elements flattened by a previous conversion
+        of the document are reused, and the cache is saved at the end.
+        With a Stats, the time spent in each stage and counters of the
+        work done are collected. Warnings and reports are written to the
+        file object [messages], if given.
+        """
+        gcode = GCodeBuilder(self.options)
+        header = gcode.header()
+
+        if stats is not None:
+            stats.count('output_bytes', len(header))
+
+        yield header
+
+        entities = self.iter_entities(source, fragment_cache, stats, messages)
+
+        if self.options.simplify > 0:
+            simplifier = PolylineSimplifier(self.options.simplify)
+            entities = simplifier.process_entities(entities)
+
+            if stats is not None:
+                entities = stats.iterate('simplify', entities)
+
+        if self.options.join_polylines:
+            joiner = PolylineJoiner(self.options.join_tolerance)
+            entities = joiner.process_entities(entities)
+
+            if stats is not None:
+                entities = stats.iterate('join', entities)
+
+        if self.options.optimize_travel:
+            optimizer = TravelOptimizer(self.options.optimize_time)
+            entities = optimizer.process_entities(entities)
+
+            if stats is not None:
+                entities = stats.iterate('optimize_travel', entities)
+
+        chunks = self.iter_chunks(gcode, entities, stats)
+
+        if stats is not None:
+            chunks = stats.iterate('gcode', chunks)
+
+        for chunk in chunks:
+            if stats is not None:
+                stats.count('output_bytes', len(chunk))
+
+            yield chunk
+
+        if self.options.simplify > 0:
+            write_message(messages, 'Simplified polylines: %i points down to %i.' % (simplifier.points_before, simplifier.points_after))
+
+        if self.options.join_polylines:
+            write_message(messages, 'Joined polylines: %i pen lifts and %i dwells saved.' % (joiner.joins, 2 * joiner.joins))
+
+        if self.options.optimize_travel:
+            write_message(messages, 'Pen-up travel: %0.1f before ordering, %0.1f after.' % (optimizer.travel_before, optimizer.travel_after))
+
+        if fragment_cache is not None:
+            write_message(messages, 'Reused %i of %i flattened elements.' % (fragment_cache.hits, fragment_cache.hits + fragment_cache.misses))
+
+            fragment_cache.save()
+
+def convert(source, options=None, fragment_cache=None, stats=None, messages=None):
+    """
+    Convert an SVG document to GCode, returning an iterator of chunks.
+    [source] is SVG bytes, a file object or an lxml tree or element, and
+    [options] an Options (the defaults if None). Warnings and reports are
+    written to the file object [messages], if given.
+    """
+    return Converter(options).convert(source, fragment_cache, stats, messages)
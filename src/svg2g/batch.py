@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import optparse
+import os
+import shlex
+import sys
+import tempfile
+import time
+
+from svg2g.cli import Svg2G
+
+class JobOptionParser(optparse.OptionParser):
+    """
+    Parser of the svg2g options of a job, raising ValueError on a bad
+    option (or --help) instead of exiting.
+    """
+    def error(self, msg):
+        raise ValueError(msg)
+
+    def exit(self, status=0, msg=None):
+        raise ValueError((msg or '').strip() or 'the options parser exited with status %s' % status)
+
+class Svg2GJob(Svg2G):
+    """
+    Svg2G for one job of a batch.
+    """
+    def make_option_parser(self):
+        return JobOptionParser(usage='usage: %prog [options] input.svg')
+
+class Job(object):
+    """
+    One file to convert: its input and output paths and the svg2g
+    arguments to convert it with.
+    """
+    def __init__(self, input_path, output_path, args):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.args = args
+
+    def get_size(self):
+        try:
+            return os.path.getsize(self.input_path)
+        except OSError:
+            return 0
+
+    def make_converter(self):
+        """
+        Parse the job's arguments into an Svg2GJob. Raises ValueError if
+        they are not valid.
+        """
+        # Workers are daemonic and cannot start a pool of their own
+        return Svg2GJob(self.args + ['--jobs=1', self.input_path])
+
+def convert(job):
+    """
+    Convert one job in a worker process. Returns the job, the number of
+    bytes written, the time taken and an error message or None.
+
+    The GCode is written to a temporary file renamed into place, so a
+    failed job leaves any previous output alone. Every error is reported,
+    including SystemExit: a worker that dies leaves the pool waiting for
+    its result forever.
+    """
+    start = time.time()
+    temporary = None
+
+    try:
+        if not os.path.isfile(job.input_path):
+            raise IOError('no such file: %s' % job.input_path)
+
+        svg2g = job.make_converter()
+
+        directory = os.path.dirname(os.path.abspath(job.output_path))
+        fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=directory)
+
+        with os.fdopen(fd, 'w') as output:
+            for chunk in svg2g.iter_gcode():
+                output.write(chunk)
+
+        os.rename(temporary, job.output_path)
+
+        return job, os.path.getsize(job.output_path), time.time() - start, None
+    except BaseException as e:
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+
+        if isinstance(e, SystemExit):
+            error = 'exited with status %s' % e.code
+        else:
+            error = str(e) or e.__class__.__name__
+
+        return job, 0, time.time() - start, error
+
+class Svg2GBatch(object):
+    """
+    Convert many SVG files with a pool of long-lived worker processes, so
+    the interpreter, lxml and the options parser are set up once per
+    worker rather than once per file.
+    """
+    def __init__(self):
+        self.get_options()
+
+    def get_options(self):
+        """
+        Get options from the command line. Options after the manifest or
+        directory are passed on to svg2g for every file.
+        """
+        self.OptionParser = optparse.OptionParser(usage='usage: %prog [batch options] manifest|directory [svg2g options]')
+        self.OptionParser.disable_interspersed_args()
+
+        self.OptionParser.add_option('--processes',
+            action='store',
+            type='int',
+            dest='processes',
+            default='0',
+            help='Number of worker processes (0 for one per CPU)')
+
+        self.OptionParser.add_option('--output-dir',
+            action='store',
+            type='string',
+            dest='output_dir',
+            default=None,
+            help='Directory for the GCode files (default: next to each input)')
+
+        self.options, self.args = self.OptionParser.parse_args(sys.argv[1:])
+
+        if not self.args:
+            self.OptionParser.error('a manifest file or a directory of SVG files is required')
+
+        self.source = self.args[0]
+        self.common_args = self.args[1:]
+
+    def get_output_path(self, input_path):
+        """
+        Get the default output path for an input: the same name with a
+        .gcode extension, in the output directory if one is given.
+        """
+        name = os.path.splitext(os.path.basename(input_path))[0] + '.gcode'
+
+        if self.options.output_dir is not None:
+            return os.path.join(self.options.output_dir, name)
+
+        return os.path.join(os.path.dirname(input_path), name)
+
+    def read_directory(self, directory):
+        """
+        Make a job for every SVG file in a directory.
+        """
+        jobs = []
+
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith('.svg'):
+                input_path = os.path.join(directory, name)
+                jobs.append(Job(input_path, self.get_output_path(input_path), self.common_args))
+
+        return jobs
+
+    def read_manifest(self, path):
+        """
+        Make a job for every line of a manifest:
+
+            input.svg [output.gcode] [svg2g options, e.g. --xoffset=30 --paper-length=80]
+
+        Relative paths are relative to the manifest. Blank lines and lines
+        starting with # are skipped.
+        """
+        base = os.path.dirname(path)
+        jobs = []
+
+        manifest = open(path, 'r')
+
+        for line in manifest:
+            words = shlex.split(line, comments=True)
+
+            if not words:
+                continue
+
+            input_path = os.path.join(base, words.pop(0))
+
+            if words and not words[0].startswith('-'):
+                output_path = os.path.join(base, words.pop(0))
+            else:
+                output_path = self.get_output_path(input_path)
+
+            jobs.append(Job(input_path, output_path, self.common_args + words))
+
+        manifest.close()
+
+        return jobs
+
+    def get_jobs(self):
+        """
+        Get the jobs to run, largest input first so that a big file
+        started last does not keep the batch waiting.
+        """
+        if os.path.isdir(self.source):
+            jobs = self.read_directory(self.source)
+        else:
+            jobs = self.read_manifest(self.source)
+
+        jobs.sort(key=lambda job: job.get_size(), reverse=True)
+
+        return jobs
+
+    def run(self):
+        """
+        Run every job and write a status line for each as it finishes.
+        Returns the number of jobs that failed.
+        """
+        jobs = self.get_jobs()
+
+        if self.options.output_dir is not None and not os.path.isdir(self.options.output_dir):
+            os.makedirs(self.options.output_dir)
+
+        processes = self.options.processes
+
+        if processes <= 0:
+            processes = multiprocessing.cpu_count()
+
+        failed = 0
+        valid = []
+
+        # Bad options are reported here rather than by the workers
+        for job in jobs:
+            try:
+                job.make_converter()
+            except ValueError as e:
+                sys.stdout.write('failed %s: %s\n' % (job.input_path, e))
+                failed += 1
+            else:
+                valid.append(job)
+
+        jobs = valid
+        pool = multiprocessing.Pool(min(processes, max(len(jobs), 1)))
+
+        try:
+            for job, size, elapsed, error in pool.imap_unordered(convert, jobs):
+                if error is None:
+                    sys.stdout.write('ok %s -> %s (%i bytes, %0.2fs)\n' % (job.input_path, job.output_path, size, elapsed))
+                else:
+                    sys.stdout.write('failed %s: %s\n' % (job.input_path, error))
+                    failed += 1
+
+                sys.stdout.flush()
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return failed
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+import hashlib
+import math
+import os
+import tempfile
+
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from lib import cubicsuperpath
+from lib import simplepath
+from svg2g import flatten
+from svg2g import transform
+from svg2g.geometry import Polylines
+from svg2g.outputcache import OutputCache
+
+class LRUCache(object):
+    """
+    A mapping that evicts its least recently used entries once the total
+    weight of what it holds goes above [max_weight].
+    """
+    def __init__(self, max_weight):
+        self.max_weight = max_weight
+        self.entries = OrderedDict()
+        self.weight = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get an entry and mark it as the most recently used, or None.
+        """
+        item = self.entries.pop(key, None)
+
+        if item is None:
+            return None
+
+        self.entries[key] = item
+
+        return item[0]
+
+    def put(self, key, value, weight=1):
+        """
+        Add or replace an entry, evicting old entries as needed.
+        """
+        old = self.entries.pop(key, None)
+
+        if old is not None:
+            self.weight -= old[1]
+
+        if weight > self.max_weight:
+            return
+
+        self.entries[key] = (value, weight)
+        self.weight += weight
+
+        while self.weight > self.max_weight:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.weight -= evicted
+
+def similarity_scale(mat):
+    """
+    Return the scale factor of an affine transform made only of
+    translation, rotation, reflection and uniform scaling, or None for
+    any other transform.
+    """
+    a, b, c, d, e, f = mat
+
+    norm = a * a + b * b
+    epsilon = 1e-9 * norm
+
+    if norm == 0 or abs(c * c + d * d - norm) > epsilon or abs(a * c + b * d) > epsilon:
+        return None
+
+    return math.sqrt(norm)
+
+def copy_superpoint(superpoint):
+    """
+    Copy the points of a CubicSuperPath superpoint. ArcToPath can put the
+    same point list twice in a superpoint, which the in-place transform
+    then moves twice; copies keep that sharing, so a copied path
+    transforms the same as the original.
+    """
+    copies = {}
+
+    return [copies.setdefault(id(point), point[:]) for point in superpoint]
+
+class GeometryCache(LRUCache):
+    """
+    Cache of parsed and flattened path geometry in local (untransformed)
+    coordinates, keyed by a digest of the path data, so that <use> clones
+    and repeated paths are parsed and flattened once.
+
+    Instances with a similarity transform are drawn from polylines
+    flattened in local coordinates, with one affine applied. They are
+    keyed by the digest and the class of the local tolerance they need,
+    flat / scale, classes being an eighth of an octave wide. Polylines
+    are flattened at the lower bound of the class, so every instance at
+    a scale gets the same polylines whatever the order instances are met
+    in: the output depends on the path data, the transform and the
+    tolerance only. It is not the same as without the cache, as the
+    polylines are slightly finer, within the tolerance.
+
+    Other instances, and all of them with the numpy backend, are
+    flattened in output coordinates: the first time some path data is
+    seen only its key is recorded, and from the second time on its
+    parsed path is reused. Their output is the same as without the
+    cache.
+
+    The weight of an entry is the number of points it holds, plus
+    entry_weight for its key and bookkeeping.
+    """
+    # An entry, its key and its place in the LRU order take about as much
+    # memory as this many points
+    entry_weight = 32
+
+    # Classes of local tolerance per octave
+    classes_per_octave = 8
+
+    def make_key(self, d):
+        if not isinstance(d, bytes):
+            d = d.encode('utf-8')
+
+        return hashlib.sha1(d).digest()
+
+    def make_path(self, cls, node, node_transform, flat, flatten_backend='python'):
+        """
+        Build an entity of class [cls] (SvgPath) for [node] from cached
+        geometry, or return None if it should be built normally.
+        """
+        d = node.get('d')
+
+        if not d:
+            return None
+
+        key = self.make_key(d)
+        scale = similarity_scale(node_transform)
+
+        # The numpy backend flattens every path in output coordinates
+        if scale is None or flatten_backend == 'numpy':
+            cubic_path = self.get_cubic_path(key, d)
+
+            if cubic_path is None:
+                return None
+
+            path = [[copy_superpoint(superpoint) for superpoint in subpath] for subpath in cubic_path]
+            transform.apply_to_path(node_transform, path)
+
+            return cls.from_geometry(path)
+
+        tolerance_class = int(math.floor(math.log(flat / scale, 2) * self.classes_per_octave))
+        polylines = self.get((key, tolerance_class))
+
+        if polylines is None:
+            path = simplepath.parsePath(d)
+
+            if len(path) == 0:
+                return None
+
+            local_flat = 2.0 ** (float(tolerance_class) / self.classes_per_octave)
+            polylines = Polylines(flatten.flatten_cubic_superpath(subpath, local_flat) for subpath in cubicsuperpath.CubicSuperPath(path))
+
+            self.put((key, tolerance_class), polylines, self.entry_weight + polylines.point_count())
+
+        return cls.from_geometry(None, transform.apply_to_polylines(node_transform, polylines))
+
+    def get_cubic_path(self, key, d):
+        """
+        Get the parsed path of some path data, or None the first time it
+        is seen.
+        """
+        cubic_path = self.get(key)
+
+        if cubic_path is None:
+            # Seen once: parsed the normal way
+            self.put(key, [], self.entry_weight)
+
+            return None
+
+        if not cubic_path:
+            path = simplepath.parsePath(d)
+
+            if len(path) == 0:
+                return None
+
+            cubic_path = cubicsuperpath.CubicSuperPath(path)
+
+            self.put(key, cubic_path, self.entry_weight + 3 * sum(len(subpath) for subpath in cubic_path))
+
+        return cubic_path
+
+class FragmentCache(object):
+    """
+    Flattened polylines of the elements of one document, kept in a file
+    between conversions so that only the elements that changed since the
+    last one are flattened again.
+
+    Elements are keyed by a digest of their tag and attributes, their
+    resolved transform and the flattening tolerance and backend, which
+    is all their polylines depend on (the geometry cache included), so
+    a fragment is the same as what a full conversion would draw. Saving
+    keeps only the entries used by the last conversion, so the file
+    follows the document instead of growing with every edit. A file
+    written by another version of the converter is ignored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as stream:
+                version, entries = pickle.load(stream)
+        except Exception:
+            # Missing, unreadable or truncated: start over
+            return
+
+        if version == OutputCache.get_version():
+            self.entries = entries
+
+    def save(self):
+        """
+        Write the entries used since the last save, atomically, and keep
+        only those.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                pickle.dump((OutputCache.get_version(), self.used), stream, pickle.HIGHEST_PROTOCOL)
+
+            os.rename(temporary, self.path)
+        except:
+            os.remove(temporary)
+            raise
+
+        self.entries = self.used
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, node, node_transform, flat, flatten_backend):
+        return hashlib.sha1(repr((node.tag, sorted(node.items()), node_transform, flat, flatten_backend)).encode('utf-8')).digest()
+
+    def get(self, key):
+        """
+        Get the polylines of an element, or None.
+        """
+        segments = self.entries.get(key)
+
+        if segments is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.used[key] = segments
+
+        return segments
+
+    def put(self, key, segments):
+        self.used[key] = segments
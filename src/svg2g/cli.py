@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+
+import hashlib
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+from svg2g import client
+from svg2g.options import Options
+from svg2g.outputcache import OutputCache
+from svg2g.stats import Stats
+
+class Svg2G(object):
+    """
+    Command line front end of Converter.
+    """
+    # Options that do not change the output, left out of the cache key
+    uncached_options = ('cache_dir', 'cache_size', 'no_cache', 'server', 'tag', 'incremental', 'watch', 'output', 'profile', 'stats')
+
+    # Seconds between checks of the input file with --watch
+    watch_interval = 0.5
+
+    def __init__(self, argv=None):
+        """
+        Get the options and input file from the command line, or from a
+        list of arguments ending with the input file.
+        """
+        if argv is None:
+            argv = sys.argv[1:]
+
+        self.get_options(argv)
+
+        self.path = argv[-1] if argv else None
+        self.conversion_options = Options.from_values(self.options)
+        self.converter = None
+        self.fragment_cache = None
+        self.cache = self.get_cache()
+
+    def get_cache(self):
+        """
+        Get the GCode output cache, or None if it is disabled or cannot
+        be used.
+        """
+        if self.options.no_cache or self.options.cache_size <= 0:
+            return None
+
+        try:
+            return OutputCache(self.options.cache_dir, int(self.options.cache_size * 1024 * 1024))
+        except (IOError, OSError) as e:
+            # inkex.errormsg would load lxml
+            sys.stderr.write('Warning: cannot use the cache directory %s (%s), not caching.\n' % (self.options.cache_dir, e))
+
+            return None
+
+    def get_converter(self):
+        if self.converter is None:
+            # Imported here so that cache hits and clients of the server
+            # never load lxml
+            from svg2g.api import Converter
+
+            self.converter = Converter(self.conversion_options)
+
+        return self.converter
+
+    def get_fragment_cache(self):
+        """
+        Get the cache of flattened elements of the input file, or None if
+        conversions are not incremental.
+        """
+        if not (self.options.incremental or self.options.watch) or self.options.server is not None:
+            return None
+
+        if self.fragment_cache is None:
+            if self.path is None or not os.path.isfile(self.path):
+                sys.stderr.write('Warning: incremental conversion needs an input file.\n')
+
+                return None
+
+            from svg2g.cache import FragmentCache
+
+            name = hashlib.sha1(os.path.abspath(self.path)).hexdigest() + '.pickle'
+            self.fragment_cache = FragmentCache(os.path.join(self.options.cache_dir, 'fragments', name))
+
+        return self.fragment_cache
+
+    def make_option_parser(self):
+        return optparse.OptionParser(usage='usage: %prog [options] input.svg')
+
+    def get_options(self, argv):
+        """
+        Get options from the command line.
+        """
+        self.OptionParser = self.make_option_parser()
+
+        Options.add_options(self.OptionParser)
+
+        self.OptionParser.add_option('--server',
+            action='store',
+            type='string',
+            dest='server',
+            default=None,
+            help='Have the server listening on this Unix socket (svg2g.py serve) do the conversion')
+
+        self.OptionParser.add_option('--cache-dir',
+            action='store',
+            type='string',
+            dest='cache_dir',
+            default=os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'svg2g'),
+            help='Directory of the GCode output cache')
+
+        self.OptionParser.add_option('--cache-size',
+            action='store',
+            type='float',
+            dest='cache_size',
+            default='256',
+            help='Size in megabytes above which the least recently used cached outputs are removed')
+
+        self.OptionParser.add_option('--no-cache',
+            action='store_true',
+            dest='no_cache',
+            default=False,
+            help='Neither use nor update the GCode output cache')
+
+        self.OptionParser.add_option('--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Keep the flattened elements of the input file in the cache directory, and only flatten those that changed on the next conversion')
+
+        self.OptionParser.add_option('--watch',
+            action='store_true',
+            dest='watch',
+            default=False,
+            help='Convert the input file again, incrementally, every time it changes (requires --output)')
+
+        self.OptionParser.add_option('--output',
+            action='store',
+            type='string',
+            dest='output',
+            default=None,
+            help='Write the GCode to this file, replaced once the conversion is complete, instead of stdout')
+
+        self.OptionParser.add_option('--profile',
+            action='store_true',
+            dest='profile',
+            default=False,
+            help='Report the time spent in each stage of the conversion and counters of the work done on stderr')
+
+        self.OptionParser.add_option('--stats',
+            action='store',
+            type='string',
+            dest='stats',
+            default=None,
+            help='Write the times and counters of --profile to this file as JSON')
+
+        # Option required for inkscape support
+        self.OptionParser.add_option('--tab',
+            action='store',
+            type='string',
+            dest='tag',
+            help='Ignored (required for Inkscape support)')
+
+        self.options, self.args = self.OptionParser.parse_args(argv)
+
+    def open_input(self, path):
+        """
+        Open the input file, or read from stdin if it can't be opened.
+        """
+        try:
+            return open(path, 'r')
+        except:
+            return sys.stdin
+
+    def get_stats(self):
+        """
+        Get the Stats to collect for a conversion, or None if they are
+        not wanted.
+        """
+        if self.options.profile or self.options.stats is not None:
+            return Stats()
+
+        return None
+
+    def write_stats(self, stats):
+        """
+        Report the statistics of a conversion.
+        """
+        if self.options.profile:
+            stats.write_report(sys.stderr)
+
+        if self.options.stats is not None:
+            try:
+                with open(self.options.stats, 'w') as output:
+                    stats.write_json(output)
+            except IOError as e:
+                sys.stderr.write('Warning: cannot write the statistics to %s (%s).\n' % (self.options.stats, e))
+
+    def iter_gcode(self):
+        """
+        Generate the GCode in chunks while the SVG is being parsed.
+        """
+        stats = self.get_stats()
+        stream = self.open_input(self.path)
+
+        try:
+            for chunk in self.iter_chunks(stream, stats):
+                yield chunk
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if stats is not None:
+            self.write_stats(stats)
+
+    def iter_chunks(self, stream, stats):
+        """
+        Get the GCode for the input [stream] from the cache, the server
+        or the converter.
+        """
+        if self.cache is not None:
+            options = dict((name, value) for name, value in vars(self.options).items() if name not in Svg2G.uncached_options)
+            key, stream = self.cache.make_key(stream, options)
+            chunks = self.cache.get(key)
+
+            if chunks is not None:
+                if stats is not None:
+                    stats.count('cache_hits')
+
+                for chunk in chunks:
+                    if stats is not None:
+                        stats.count('output_bytes', len(chunk))
+
+                    yield chunk
+
+                return
+
+        if self.options.server is None:
+            if stats is not None:
+                stats.start('load')
+
+            converter = self.get_converter()
+
+            if stats is not None:
+                stats.stop()
+
+            chunks = converter.convert(stream, self.get_fragment_cache(), stats, sys.stderr)
+        else:
+            chunks = client.request(self.options.server, vars(self.conversion_options), stream.read(), messages=sys.stderr)
+
+            if stats is not None:
+                chunks = stats.iterate('server', chunks)
+
+        if self.cache is not None:
+            chunks = self.cache.put(key, chunks)
+
+        for chunk in chunks:
+            if stats is not None and self.options.server is not None:
+                stats.count('output_bytes', len(chunk))
+
+            yield chunk
+
+    def write_output(self):
+        """
+        Convert to the --output file, through a temporary file so that it
+        is never seen half written.
+        """
+        directory = os.path.dirname(os.path.abspath(self.options.output))
+        fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=directory)
+
+        try:
+            with os.fdopen(fd, 'w') as output:
+                for chunk in self.iter_gcode():
+                    output.write(chunk)
+
+            os.rename(temporary, self.options.output)
+        except:
+            os.remove(temporary)
+            raise
+
+    def get_input_state(self):
+        try:
+            status = os.stat(self.path)
+        except OSError:
+            # Being replaced by the editor
+            return None
+
+        return status.st_mtime, status.st_size, status.st_ino
+
+    def watch(self):
+        """
+        Convert the input file to the --output file every time it
+        changes, until interrupted.
+        """
+        if self.options.output is None or self.path is None or not os.path.isfile(self.path):
+            self.OptionParser.error('--watch needs an input file and --output')
+
+        last = None
+
+        try:
+            while True:
+                state = self.get_input_state()
+
+                if state is not None and state != last:
+                    last = state
+                    start = time.time()
+
+                    try:
+                        self.write_output()
+                    except Exception as e:
+                        sys.stderr.write('Error: %s\n' % e)
+                    else:
+                        sys.stderr.write('Converted %s in %0.2fs.\n' % (self.path, time.time() - start))
+
+                time.sleep(Svg2G.watch_interval)
+        except KeyboardInterrupt:
+            pass
+
+    def run(self, output=None):
+        """
+        Execute the parser and write the GCode to [output], the --output
+        file or stdout as it is generated.
+        """
+        try:
+            if self.options.watch:
+                self.watch()
+            elif output is None and self.options.output is not None:
+                self.write_output()
+            else:
+                if output is None:
+                    output = sys.stdout
+
+                for chunk in self.iter_gcode():
+                    output.write(chunk)
+        except client.ServerError as e:
+            sys.stderr.write('Error: %s\n' % e)
+            sys.exit(1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import errno
+import json
+import socket
+import struct
+
+# Frames sent back by the server: a kind byte and a payload length,
+# then the payload
+FRAME_HEADER = struct.Struct('!cI')
+
+DATA = b'D'
+MESSAGES = b'M'
+ERROR = b'E'
+DONE = b'K'
+
+class ServerError(Exception):
+    """
+    The server could not convert the document, or could not be reached.
+    """
+    pass
+
+def retry_on_eintr(function, *args):
+    """
+    Call [function] with [args], again whenever it fails because a signal
+    arrived: Python 2 does not restart interrupted socket calls.
+    """
+    while True:
+        try:
+            return function(*args)
+        except socket.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+def send_all(connection, data):
+    """
+    Send all of [data] to a socket. Unlike socket.sendall, this resumes
+    where it was when a signal interrupts it.
+    """
+    data = memoryview(data)
+
+    while len(data):
+        data = data[retry_on_eintr(connection.send, data):]
+
+def receive(connection, size):
+    """
+    Read up to [size] bytes from a socket.
+    """
+    return retry_on_eintr(connection.recv, size)
+
+def send_frame(connection, kind, payload=b''):
+    send_all(connection, FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+def receive_exactly(connection, size):
+    """
+    Read [size] bytes from a socket, or fewer if it is closed first.
+    """
+    data = []
+
+    while size > 0:
+        chunk = receive(connection, min(size, 65536))
+
+        if not chunk:
+            break
+
+        data.append(chunk)
+        size -= len(chunk)
+
+    return b''.join(data)
+
+def receive_frames(connection):
+    """
+    Yield the (kind, payload) frames sent back by the server.
+    """
+    while True:
+        header = receive_exactly(connection, FRAME_HEADER.size)
+
+        if len(header) < FRAME_HEADER.size:
+            raise ServerError('connection closed by the server')
+
+        kind, size = FRAME_HEADER.unpack(header)
+
+        yield kind, receive_exactly(connection, size)
+
+def request(path, options, source, messages=None, timeout=None):
+    """
+    Have the server listening on the Unix socket [path] convert the SVG
+    bytes [source] with [options] (a dict of Options fields), and yield
+    the GCode in chunks as it arrives. The warnings and reports of the
+    conversion are written to [messages] if given.
+
+    The request is one line of JSON options followed by the SVG, up to
+    the end of the stream.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+
+    try:
+        try:
+            connection.connect(path)
+        except socket.error as e:
+            raise ServerError('cannot connect to %s: %s' % (path, e))
+
+        send_all(connection, json.dumps(options).encode('utf-8') + b'\n')
+        send_all(connection, source)
+        connection.shutdown(socket.SHUT_WR)
+
+        for kind, payload in receive_frames(connection):
+            if kind == DATA:
+                yield payload
+            elif kind == MESSAGES:
+                if messages is not None:
+                    messages.write(payload)
+            elif kind == ERROR:
+                raise ServerError(payload.decode('utf-8', 'replace'))
+            elif kind == DONE:
+                return
+    finally:
+        connection.close()
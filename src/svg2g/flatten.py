@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+import itertools
+import math
+
+from lib import cubicsuperpath
+from svg2g import transform
+from svg2g.geometry import Polylines
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def is_flat(p0, p1, p2, p3, flat):
+    """
+    Check whether both control points of a cubic bezier lie within
+    [flat] of the chord between its endpoints.
+
+    Uses the same arithmetic as ffgeom.Segment.distanceToPoint so that
+    flattened output is identical, without allocating Point objects.
+    """
+    p0x, p0y = p0
+    p3x, p3y = p3
+    dx = p3x - p0x
+    dy = p3y - p0y
+    c2 = dx * dx + dy * dy
+
+    for px, py in (p1, p2):
+        c1 = (px - p0x) * dx + (py - p0y) * dy
+
+        if c1 <= 0:
+            distance = math.sqrt(((p0x - px) ** 2) + ((p0y - py) ** 2))
+        elif c2 <= c1:
+            distance = math.sqrt(((p3x - px) ** 2) + ((p3y - py) ** 2))
+        else:
+            distance = math.fabs((dx * (p0y - py)) - ((p0x - px) * dy)) / math.sqrt((dx ** 2) + (dy ** 2))
+
+        if distance > flat:
+            return False
+
+    return True
+
+def split_cubic(b):
+    """
+    Split a cubic bezier in half (de Casteljau), same as
+    bezmisc.beziersplitatt(b, 0.5).
+    """
+    ((bx0, by0), (bx1, by1), (bx2, by2), (bx3, by3)) = b
+
+    m1 = (bx0 + 0.5 * (bx1 - bx0), by0 + 0.5 * (by1 - by0))
+    m2 = (bx1 + 0.5 * (bx2 - bx1), by1 + 0.5 * (by2 - by1))
+    m3 = (bx2 + 0.5 * (bx3 - bx2), by2 + 0.5 * (by3 - by2))
+    m4 = (m1[0] + 0.5 * (m2[0] - m1[0]), m1[1] + 0.5 * (m2[1] - m1[1]))
+    m5 = (m2[0] + 0.5 * (m3[0] - m2[0]), m2[1] + 0.5 * (m3[1] - m2[1]))
+    m = (m4[0] + 0.5 * (m5[0] - m4[0]), m4[1] + 0.5 * (m5[1] - m4[1]))
+
+    return ((bx0, by0), m1, m4, m), (m, m5, m3, (bx3, by3))
+
+def append_cubic(append, b, flat):
+    """
+    Subdivide the cubic bezier [b] until every piece is a straight line
+    within [flat], and pass the points between the pieces to [append].
+    The end point of [b] is left to the caller.
+
+    Each curve is subdivided with its own work stack, so the cost is
+    linear in the number of points emitted.
+    """
+    stack = [b]
+
+    while stack:
+        b = stack.pop()
+
+        if is_flat(b[0], b[1], b[2], b[3], flat):
+            # The last piece ends on the end point of the curve
+            if stack:
+                append(b[3])
+        else:
+            one, two = split_cubic(b)
+            stack.append(two)
+            stack.append(one)
+
+def flatten_cubic_superpath(cubic_bezier_path, flat):
+    """
+    Flatten one subpath of a CubicSuperPath into a list of points, each
+    curve being subdivided until it is a straight line within [flat].
+
+    Points are appended to a fresh list, so the cost is linear in the
+    number of points emitted. The output is identical to the old
+    in-place splicing version of SvgPath._subdivide_cubic_bezier_path.
+    """
+    if not cubic_bezier_path:
+        return []
+
+    points = [cubic_bezier_path[0][1]]
+
+    for i in range(1, len(cubic_bezier_path)):
+        start = cubic_bezier_path[i - 1]
+        end = cubic_bezier_path[i]
+
+        append_cubic(points.append, (start[1], start[2], end[0], end[1]), flat)
+        points.append(end[1])
+
+    return points
+
+def flatten_path(path, m, flat, stats=None):
+    """
+    Flatten a path parsed by simplepath.parsePath and transformed by the
+    affine [m] into a Polylines buffer in output coordinates.
+
+    This does in one pass what CubicSuperPath, transform.apply_to_path
+    and flatten_cubic_superpath do in three. Each command gives the
+    superpoints CubicSuperPath would have built, which are transformed
+    and flattened right away instead of being collected, copied and
+    transformed in place, and points go straight into the buffer's
+    coordinates. Straight segments are appended without a flatness
+    test. The output is identical.
+
+    The curves subdivided are counted in [stats], if not None.
+    """
+    a, b, c, d, e, f = m
+    identity = m is transform.IDENTITY
+
+    polylines = Polylines()
+    coordinates = polylines.coordinates
+    put = coordinates.append
+    extend = coordinates.extend
+    drawing = False
+    curves = 0
+
+    # Point and outgoing control of the last superpoint, transformed
+    qx = qy = rx = ry = 0.0
+
+    # Current point, incoming control of the next superpoint and start
+    # of the subpath, untransformed
+    lx = ly = kx = ky = sx = sy = None
+
+    # The moveto without parameters ends the last subpath
+    for cmd, params in itertools.chain(path, [('M', None)]):
+        transformed = identity
+
+        # Superpoints as (in x, in y, x, y, out x, out y)
+        if cmd == 'M':
+            superpoints = ((kx, ky, lx, ly, lx, ly),) if lx is not None else ()
+        elif cmd == 'L':
+            superpoints = ((kx, ky, lx, ly, lx, ly),)
+            lx, ly = kx, ky = params
+        elif cmd == 'C':
+            superpoints = ((kx, ky, lx, ly, params[0], params[1]),)
+            kx, ky, lx, ly = params[2:]
+        elif cmd == 'Q':
+            q1x, q1y, q2x, q2y = params
+            x1 = 1./3*lx+2./3*q1x
+            y1 = 1./3*ly+2./3*q1y
+            superpoints = ((kx, ky, lx, ly, x1, y1),)
+            kx = 2./3*q1x+1./3*q2x
+            ky = 2./3*q1y+1./3*q2y
+            lx, ly = q2x, q2y
+        elif cmd == 'A':
+            arcp = cubicsuperpath.ArcToPath([lx, ly], params)
+            arcp[0][0] = [kx, ky]
+            (kx, ky), (lx, ly) = arcp[-1][0], arcp[-1][1]
+
+            # ArcToPath can return the same point list twice in a
+            # superpoint, which the in-place transform then moves twice
+            arc = arcp[:-1]
+            transform.apply_to_path(m, [arc])
+            transformed = True
+
+            superpoints = [(i[0], i[1], p[0], p[1], o[0], o[1]) for i, p, o in arc]
+        elif cmd == 'Z':
+            superpoints = ((kx, ky, lx, ly, lx, ly),)
+            lx, ly = kx, ky = sx, sy
+
+        for ix, iy, x, y, ox, oy in superpoints:
+            if not transformed:
+                ix, iy = a * ix + c * iy + e, b * ix + d * iy + f
+                x, y = a * x + c * y + e, b * x + d * y + f
+                ox, oy = a * ox + c * oy + e, b * ox + d * oy + f
+
+            if drawing and not (qx == rx and qy == ry and ix == x and iy == y):
+                append_cubic(extend, ((qx, qy), (rx, ry), (ix, iy), (x, y)), flat)
+                curves += 1
+
+            put(x)
+            put(y)
+            drawing = True
+
+            qx, qy, rx, ry = x, y, ox, oy
+
+        if cmd == 'M':
+            if drawing:
+                polylines.offsets.append(len(coordinates) // 2)
+                drawing = False
+
+            if params is not None:
+                lx, ly = kx, ky = sx, sy = params
+
+    if stats is not None:
+        stats.count('curves', curves)
+
+    return polylines
+
+def count_curves(cubic_path):
+    """
+    Count the curves of a CubicSuperPath that are not straight lines,
+    the same ones as flatten_path subdivides.
+    """
+    curves = 0
+
+    for subpath in cubic_path:
+        for i in range(1, len(subpath)):
+            start = subpath[i - 1]
+            end = subpath[i]
+
+            if not (start[1] == start[2] and end[0] == end[1]):
+                curves += 1
+
+    return curves
+
+def flatten_batch(paths, flat):
+    """
+    Flatten many CubicSuperPaths at once and return a list of segments
+    (one list of polylines per path).
+
+    Every cubic in every path is gathered into a single (N, 4, 2) array.
+    Each curve gets a subdivision count from Wang's formula, which
+    guarantees the polyline stays within [flat] of the curve, and all
+    points are evaluated in a handful of array operations. Falls back to
+    flatten_cubic_superpath() if NumPy is not available.
+
+    Wang's formula is a worst-case bound over the whole curve, and the
+    points are evenly spaced in t, so this gives more points than the
+    adaptive subdivision of flatten_cubic_superpath(): typically 1.4 to
+    2 times as many. Splitting adaptively would give up the batching;
+    a simplification pass (--simplify) removes most of the extra points.
+    """
+    if numpy is None:
+        return [[flatten_cubic_superpath(p, flat) for p in path] for path in paths]
+
+    curves = []
+    starts = []
+
+    for path in paths:
+        for cubic_bezier_path in path:
+            starts.append(len(curves))
+
+            for i in range(1, len(cubic_bezier_path)):
+                start = cubic_bezier_path[i - 1]
+                end = cubic_bezier_path[i]
+
+                curves.append((start[1], start[2], end[0], end[1]))
+
+    if curves:
+        b = numpy.array(curves, dtype=float)
+
+        # Wang's formula for a cubic: n = sqrt(3 * 2 / 8 * M / flat)
+        # where M is the largest second difference of the control points
+        d1 = b[:, 0] - 2 * b[:, 1] + b[:, 2]
+        d2 = b[:, 1] - 2 * b[:, 2] + b[:, 3]
+        m = numpy.maximum(numpy.hypot(d1[:, 0], d1[:, 1]), numpy.hypot(d2[:, 0], d2[:, 1]))
+        counts = numpy.maximum(numpy.ceil(numpy.sqrt(0.75 * m / flat)), 1).astype(numpy.intp)
+
+        offsets = numpy.cumsum(counts)
+        index = numpy.repeat(numpy.arange(len(curves)), counts)
+        k = numpy.arange(offsets[-1]) - numpy.repeat(offsets - counts, counts) + 1
+        t = (k / counts[index].astype(float))[:, numpy.newaxis]
+        mt = 1.0 - t
+
+        b = b[index]
+        evaluated = (mt * mt * mt * b[:, 0] + 3 * mt * mt * t * b[:, 1] +
+            3 * mt * t * t * b[:, 2] + t * t * t * b[:, 3]).tolist()
+        offsets = [0] + offsets.tolist()
+    else:
+        evaluated = []
+        offsets = [0]
+
+    segments = []
+    subpath = 0
+
+    for path in paths:
+        path_segments = []
+
+        for cubic_bezier_path in path:
+            first = starts[subpath]
+            last = first + len(cubic_bezier_path) - 1
+            subpath += 1
+
+            if not cubic_bezier_path:
+                path_segments.append([])
+                continue
+
+            points = [cubic_bezier_path[0][1]]
+            points.extend(evaluated[offsets[first]:offsets[last]])
+            path_segments.append(points)
+
+        segments.append(path_segments)
+
+    return segments
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+import itertools
+import math
 import sys
 import re
 
@@ -7,12 +9,23 @@ class GCodeBuilder:
     """
     Build a GCode instruction set.
     """
+    # Smallest step representable by the %0.2f coordinates written below
+    resolution = 0.01
+
+    # Limits for replacing points with arcs (see draw_arcs)
+    min_arc_segments = 3
+    max_arc_radius = 1000.0
+    max_arc_sweep = 1.5 * math.pi
+
     def __init__(self, options):
         self.codes = []
         self.config = vars(options)
         self.drawing = False
         self.last = None
         self.end_paper_to_feed = 0
+        self.compact = self.config.get('compact', False)
+        self.strip_comments = self.config.get('strip_comments', False)
+        self.modal = {'X': None, 'Y': None, 'F': None}
         
     def preamble(self):
         return [
@@ -74,20 +87,77 @@ class GCodeBuilder:
         """
         Start drawing a shape
         """
-        self.codes.append('(lower pen)')
+        self.label('lower pen')
         self.codes.append('M5 M400 M3 S100')
-        self.codes.append('G4 P%(stop_delay).2f' % self.config)
+        self.codes.append('G4 P%s' % self.format_number(self.config['stop_delay']))
         self.drawing = True
 
     def stop(self):
         """
         Stop drawing a shape
         """
-        self.codes.append('(raise pen)')
+        self.label('raise pen')
         self.codes.append('M3 S100 M400 M5') 
-        self.codes.append('G4 P%(stop_delay).2f' % self.config)
+        self.codes.append('G4 P%s' % self.format_number(self.config['stop_delay']))
         self.drawing = False
 
+    def format_number(self, value):
+        """
+        Format a number with two decimals, without trailing zeros in
+        compact mode.
+        """
+        text = '%0.2f' % value
+
+        if self.compact:
+            text = text.rstrip('0').rstrip('.')
+
+            if text == '-0':
+                text = '0'
+
+        return text
+
+    def move(self, command, x, y, distX, offset=None):
+        """
+        Write a G1 move, or a G2/G3 arc around [offset] (I, J). In compact
+        mode, words that would not change the modal state (position,
+        feedrate) and zero paper feed are left out.
+        """
+        if not self.compact:
+            if offset is None:
+                self.codes.append('%s X%0.2f Y%0.2f E%0.2f F%0.2f' % (command, x, y, distX, self.config['xy_feedrate']))
+            else:
+                self.codes.append('%s X%0.2f Y%0.2f I%0.2f J%0.2f E%0.2f F%0.2f' % (command, x, y, offset[0], offset[1], distX, self.config['xy_feedrate']))
+
+            return
+
+        words = [command]
+
+        X = self.format_number(x)
+        Y = self.format_number(y)
+        E = self.format_number(distX)
+        F = self.format_number(self.config['xy_feedrate'])
+
+        if X != self.modal['X']:
+            words.append('X' + X)
+
+        if Y != self.modal['Y']:
+            words.append('Y' + Y)
+
+        if offset is not None:
+            words.append('I' + self.format_number(offset[0]))
+            words.append('J' + self.format_number(offset[1]))
+
+        if E != '0':
+            words.append('E' + E)
+
+        if F != self.modal['F']:
+            words.append('F' + F)
+
+        self.modal.update(X=X, Y=Y, F=F)
+
+        if len(words) > 1:
+            self.codes.append(' '.join(words))
+
     def go_to_point(self, x, y, stop=False):
         """
         Move the print head to a certain point.
@@ -105,7 +175,7 @@ class GCodeBuilder:
                 distX = abs(self.last[0] - x)
             else:
                 distX = 0.0
-            self.codes.append('G1 X%0.2f Y%0.2f E%0.2f F%0.2f' % (x, y, distX, self.config['xy_feedrate']))
+            self.move('G1', x, y, distX)
 
         self.last = (x, y)
 
@@ -121,7 +191,7 @@ class GCodeBuilder:
 
         distX = abs(self.last[0] - x)
             
-        self.codes.append('G1 X%0.2f Y%0.2f E%0.2f F%0.2f' % (x, y, distX, self.config['xy_feedrate']))
+        self.move('G1', x, y, distX)
 
         self.last = (x, y)
 
@@ -129,7 +199,8 @@ class GCodeBuilder:
         """
         Write a text label/comment into the output.
         """
-        self.codes.append('(' + text + ')')
+        if not self.strip_comments:
+            self.codes.append('(' + text + ')')
 
     def draw_polyline(self, points):
         """
@@ -140,30 +211,232 @@ class GCodeBuilder:
         self.go_to_point(start[0],start[1])
         self.start()
 
-        for point in points[1:]:
-            self.draw_to_point(point[0],point[1])
-            self.last = point
+        if self.config.get('fit_arcs'):
+            self.draw_arcs(points)
+        elif self.compact:
+            for point in itertools.islice(points, 1, None):
+                self.draw_to_point(point[0],point[1])
+                self.last = point
+        else:
+            self.draw_points(points)
 
         self.stop()
 
+    def draw_points(self, points):
+        """
+        Draw to every point of a polyline after the first, with the same
+        output as calling draw_to_point() for each of them, but with the
+        paper feeds computed in one pass and all the lines formatted by a
+        single string operation into one buffer.
+        """
+        values = []
+        last = self.last
+
+        for point in itertools.islice(points, 1, None):
+            x = point[0]
+            y = point[1]
+
+            if last != (x, y):
+                values.extend((x, y, abs(last[0] - x)))
+
+            last = point
+
+        if values:
+            line = 'G1 X%%0.2f Y%%0.2f E%%0.2f F%0.2f' % self.config['xy_feedrate']
+
+            self.codes.append('\n'.join([line] * (len(values) // 3)) % tuple(values))
+
+        self.last = last
+
+    def fit_arc(self, points, i, j):
+        """
+        Check whether points i to j lie on a circular arc, within the arc
+        tolerance of the circle and with every chord within it too.
+        Returns the center and whether the arc is counter-clockwise, or
+        None.
+        """
+        tolerance = self.config['arc_tolerance']
+
+        (ax, ay), (bx, by), (cx, cy) = points[i], points[(i + j) // 2], points[j]
+
+        # Twice the signed area of the triangle, positive if counter-clockwise
+        det = 2 * ((bx - ax) * (cy - ay) - (cx - ax) * (by - ay))
+
+        if abs(det) < 1e-12:
+            return None
+
+        a2 = ax * ax + ay * ay
+        b2 = bx * bx + by * by
+        c2 = cx * cx + cy * cy
+        ox = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / det
+        oy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / det
+        radius = math.sqrt((ax - ox) ** 2 + (ay - oy) ** 2)
+
+        if radius > self.max_arc_radius:
+            return None
+
+        ccw = det > 0
+        sweep = 0.0
+
+        for k in range(i, j):
+            px, py = points[k][0] - ox, points[k][1] - oy
+            qx, qy = points[k + 1][0] - ox, points[k + 1][1] - oy
+
+            if abs(math.sqrt(qx * qx + qy * qy) - radius) > tolerance:
+                return None
+
+            chord2 = (qx - px) ** 2 + (qy - py) ** 2
+
+            if chord2 == 0:
+                continue
+
+            cross = px * qy - py * qx
+
+            if (cross > 0) != ccw or cross == 0:
+                return None
+
+            # Sagitta of the arc over this chord
+            if radius - math.sqrt(max(radius * radius - chord2 / 4, 0.0)) > tolerance:
+                return None
+
+            sweep += abs(math.atan2(cross, px * qx + py * qy))
+
+        if sweep > self.max_arc_sweep:
+            return None
+
+        return (ox, oy), ccw
+
+    def find_arc(self, points, i):
+        """
+        Find the longest run of points starting at i that fits an arc of at
+        least min_arc_segments segments. Returns the index of its last
+        point and the fit, or None.
+        """
+        n = len(points)
+        j = i + self.min_arc_segments
+
+        if j >= n:
+            return None
+
+        fit = self.fit_arc(points, i, j)
+
+        if fit is None:
+            return None
+
+        # Grow the run exponentially, then bisect the last step
+        good = j
+        bad = n
+        step = self.min_arc_segments
+
+        while good + step < n:
+            candidate = self.fit_arc(points, i, good + step)
+
+            if candidate is None:
+                bad = good + step
+                break
+
+            good, fit = good + step, candidate
+            step *= 2
+
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            candidate = self.fit_arc(points, i, middle)
+
+            if candidate is None:
+                bad = middle
+            else:
+                good, fit = middle, candidate
+
+        # An arc that ends where it starts would be read as a full circle
+        if '%0.2f %0.2f' % (points[good][0], points[good][1]) == '%0.2f %0.2f' % (points[i][0], points[i][1]):
+            return None
+
+        return good, fit
+
+    def arc_to_point(self, points, i, j, center, ccw):
+        """
+        Draw an arc from point i to point j. The paper feed (E) is the X
+        travel of the segments it replaces.
+        """
+        x, y = points[j][0], points[j][1]
+
+        distX = 0.0
+
+        for k in range(i, j):
+            distX += abs(points[k + 1][0] - points[k][0])
+
+        self.move('G3' if ccw else 'G2', x, y, distX, (center[0] - points[i][0], center[1] - points[i][1]))
+
+        self.last = points[j]
+
+    def draw_arcs(self, points):
+        """
+        Draw the rest of a polyline, replacing runs of points that lie on a
+        circular arc with G2/G3 arcs.
+        """
+        i = 0
+
+        while i < len(points) - 1:
+            arc = self.find_arc(points, i)
+
+            if arc is None:
+                point = points[i + 1]
+                self.draw_to_point(point[0], point[1])
+                self.last = point
+                i += 1
+            else:
+                j, (center, ccw) = arc
+                self.arc_to_point(points, i, j, center, ccw)
+                i = j
+
     def change_layer(self, name):
         """
         Change layer being drawn.
         """
         # pass
         
-    def build(self):
+    def header(self):
         """
-        Build complete GCode and return as string. 
+        Return the start of the GCode as a string.
         """
-        commands = []
+        return '\n'.join(self.remove_comments(self.preamble())) + '\n'
 
-        commands.extend(self.preamble())
+    def flush(self):
+        """
+        Return the instructions generated since the last flush as a string
+        and forget them, so output can be written as it is generated.
+        """
+        chunk = ''.join([code + '\n' for code in self.codes])
 
-        commands.extend(self.codes)
-            
+        self.codes = []
+
+        return chunk
+
+    def footer(self):
+        """
+        Return the end of the GCode as a string.
+        """
         self.end_paper_to_feed = self.config['paper_length']
 
-        commands.extend(self.postscript())
+        if self.strip_comments:
+            return ''.join([line + '\n' for line in self.remove_comments(self.postscript())])
+
+        return '\n'.join(self.postscript())
+
+    def remove_comments(self, lines):
+        """
+        Remove comments, and the lines left empty, when comments are
+        stripped.
+        """
+        if not self.strip_comments:
+            return lines
+
+        lines = [re.sub(r'\s*\([^)]*\)', '', line).strip() for line in lines]
+
+        return [line for line in lines if line]
 
-        return '\n'.join(commands)
+    def build(self):
+        """
+        Build complete GCode and return as string. 
+        """
+        return self.header() + self.flush() + self.footer()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+from array import array
+
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
+
+class PolylineView(object):
+    """
+    A read-only sequence of (x, y) tuples for one polyline of a Polylines
+    buffer. Slicing returns a list.
+    """
+    __slots__ = ('coordinates', 'start', 'end')
+
+    def __init__(self, coordinates, start, end):
+        self.coordinates = coordinates
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+
+        if key < 0:
+            key += len(self)
+
+        if key < 0 or key >= len(self):
+            raise IndexError('polyline index out of range')
+
+        i = 2 * (self.start + key)
+
+        return (self.coordinates[i], self.coordinates[i + 1])
+
+    def get_coordinates(self):
+        """
+        Return the flat x, y coordinates of the polyline as an array.
+        """
+        return self.coordinates[2 * self.start:2 * self.end]
+
+    def __iter__(self):
+        return izip(self.coordinates[2 * self.start:2 * self.end:2], self.coordinates[2 * self.start + 1:2 * self.end:2])
+
+    def __repr__(self):
+        return repr(list(self))
+
+class Polylines(object):
+    """
+    A list of polylines stored as one flat array of x, y coordinates and
+    an array of offsets where each polyline starts, instead of lists of
+    point lists. Iterating it yields a PolylineView per polyline.
+    """
+    __slots__ = ('coordinates', 'offsets')
+
+    def __init__(self, polylines=()):
+        self.coordinates = array('d')
+        self.offsets = array('l', [0])
+
+        for points in polylines:
+            self.append(points)
+
+    def append(self, points):
+        """
+        Add a polyline from any sequence of (x, y) points.
+        """
+        if isinstance(points, PolylineView):
+            self.coordinates.extend(points.get_coordinates())
+        else:
+            for point in points:
+                self.coordinates.append(point[0])
+                self.coordinates.append(point[1])
+
+        self.offsets.append(len(self.coordinates) // 2)
+
+    def __getstate__(self):
+        return self.coordinates, self.offsets
+
+    def __setstate__(self, state):
+        self.coordinates, self.offsets = state
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if key < 0:
+            key += len(self)
+
+        if key < 0 or key >= len(self):
+            raise IndexError('polyline index out of range')
+
+        return PolylineView(self.coordinates, self.offsets[key], self.offsets[key + 1])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield PolylineView(self.coordinates, self.offsets[i], self.offsets[i + 1])
+
+    def __repr__(self):
+        return repr([list(points) for points in self])
+
+    def point_count(self):
+        return len(self.coordinates) // 2
@@ -0,0 +1,527 @@
+#!/usr/bin/env python
+
+import math
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from svg2g.geometry import Polylines, PolylineView
+from svg2g.svg import SvgLayerChange, SvgPath
+
+def is_closed(points):
+    """
+    Check whether a polyline ends where it starts.
+    """
+    return len(points) > 2 and tuple(points[0]) == tuple(points[-1])
+
+def distance(p1, p2):
+    return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+
+def travel_distance(polylines, start=(0.0, 0.0)):
+    """
+    Total pen-up distance needed to draw [polylines] in order, starting
+    at [start].
+    """
+    total = 0.0
+    last = start
+
+    for points in polylines:
+        total += distance(last, points[0])
+        last = points[-1]
+
+    return total
+
+class SpatialGrid(object):
+    """
+    Uniform grid of points for nearest neighbour queries. Each point
+    carries an item, and items can be removed as they are used.
+    """
+    def __init__(self, entries):
+        xs = [x for x, y, item in entries]
+        ys = [y for x, y, item in entries]
+
+        width = max(xs) - min(xs)
+        height = max(ys) - min(ys)
+        area = max(width * height, width * width, height * height, 1e-6)
+
+        self.cell = math.sqrt(area / len(entries)) * 2
+        self.cells = {}
+
+        for x, y, item in entries:
+            self.cells.setdefault((int(math.floor(x / self.cell)), int(math.floor(y / self.cell))), []).append((x, y, item))
+
+        columns = [c[0] for c in self.cells]
+        rows = [c[1] for c in self.cells]
+        self.bounds = (min(columns), max(columns), min(rows), max(rows))
+
+    def nearest(self, x, y, is_alive):
+        """
+        Find the nearest entry whose item passes [is_alive], searching
+        rings of cells outward from (x, y). Dead entries are dropped as
+        they are found.
+        """
+        column = int(math.floor(x / self.cell))
+        row = int(math.floor(y / self.cell))
+        min_column, max_column, min_row, max_row = self.bounds
+
+        reach = max(abs(column - min_column), abs(column - max_column), abs(row - min_row), abs(row - max_row))
+
+        best = None
+        best_distance = float('inf')
+
+        for ring in range(reach + 1):
+            for i in range(column - ring, column + ring + 1):
+                if i < min_column or i > max_column:
+                    continue
+
+                if abs(i - column) == ring:
+                    js = range(row - ring, row + ring + 1)
+                else:
+                    js = (row - ring, row + ring)
+
+                for j in js:
+                    entries = self.cells.get((i, j))
+
+                    if not entries:
+                        continue
+
+                    alive = [entry for entry in entries if is_alive(entry[2])]
+
+                    if len(alive) != len(entries):
+                        if alive:
+                            self.cells[(i, j)] = alive
+                        else:
+                            del self.cells[(i, j)]
+
+                    for ex, ey, item in alive:
+                        d = (ex - x) ** 2 + (ey - y) ** 2
+
+                        if d < best_distance:
+                            best = item
+                            best_distance = d
+
+            # Anything in the next ring is at least this far away
+            if best is not None and best_distance <= (ring * self.cell) ** 2:
+                break
+
+        return best
+
+def order_nearest_neighbour(polylines, start):
+    """
+    Greedily order polylines so each one starts at the nearest available
+    point from where the previous one ended. Open polylines may be drawn
+    backwards, closed ones may start at any of their vertices.
+
+    Returns a list of (index, reverse, start vertex).
+    """
+    used = [False] * len(polylines)
+    remaining = len(polylines)
+    order = []
+    x, y = start
+
+    def is_alive(item):
+        return not used[item[0]]
+
+    def make_grid():
+        entries = []
+
+        for i, points in enumerate(polylines):
+            if used[i]:
+                continue
+
+            if is_closed(points):
+                for k in range(len(points) - 1):
+                    entries.append((points[k][0], points[k][1], (i, False, k)))
+            else:
+                entries.append((points[0][0], points[0][1], (i, False, 0)))
+                entries.append((points[-1][0], points[-1][1], (i, True, 0)))
+
+        return SpatialGrid(entries)
+
+    grid = make_grid()
+    grid_size = remaining
+
+    while remaining:
+        # Rebuild once most strokes are gone, so searches don't crawl
+        # through a sparse grid
+        if remaining * 4 < grid_size:
+            grid = make_grid()
+            grid_size = remaining
+
+        item = grid.nearest(x, y, is_alive)
+        index, reverse, vertex = item
+
+        used[index] = True
+        remaining -= 1
+        order.append(item)
+
+        points = polylines[index]
+
+        if is_closed(points):
+            x, y = points[vertex]
+        elif reverse:
+            x, y = points[0]
+        else:
+            x, y = points[-1]
+
+    return order
+
+def arrange(points, reverse, vertex):
+    """
+    Return the points of a polyline reversed or, if it is closed,
+    starting at another vertex.
+    """
+    if reverse:
+        return points[::-1]
+
+    if vertex:
+        return points[vertex:-1] + points[:vertex] + [points[vertex]]
+
+    return points
+
+def improve_2opt(strokes, start, time_limit, window=64):
+    """
+    Improve a stroke order in place with 2-opt moves: reversing a run
+    of strokes (and each stroke within it) whenever it shortens travel.
+    Only runs of up to [window] strokes are tried, and the search stops
+    after [time_limit] seconds.
+    """
+    deadline = time.time() + time_limit
+    improved = True
+
+    while improved and time.time() < deadline:
+        improved = False
+
+        for i in range(-1, len(strokes) - 1):
+            if i % 256 == 0 and time.time() > deadline:
+                break
+
+            end_i = strokes[i][-1] if i >= 0 else start
+            start_next = strokes[i + 1][0]
+            before_i = distance(end_i, start_next)
+
+            for j in range(i + 1, min(i + 1 + window, len(strokes))):
+                end_j = strokes[j][-1]
+
+                if j + 1 < len(strokes):
+                    start_after = strokes[j + 1][0]
+                    before = before_i + distance(end_j, start_after)
+                    after = distance(end_i, end_j) + distance(start_next, start_after)
+                else:
+                    before = before_i
+                    after = distance(end_i, end_j)
+
+                if after < before - 1e-9:
+                    strokes[i + 1:j + 1] = [points[::-1] for points in reversed(strokes[i + 1:j + 1])]
+                    start_next = strokes[i + 1][0]
+                    before_i = distance(end_i, start_next)
+                    improved = True
+
+def order_polylines(polylines, start=(0.0, 0.0), time_limit=1.0):
+    """
+    Reorder polylines to reduce pen-up travel: nearest neighbour order
+    built with a spatial grid, then time-boxed 2-opt.
+    """
+    polylines = [points for points in polylines if len(points)]
+
+    if len(polylines) < 2 and not any(is_closed(points) for points in polylines):
+        return polylines
+
+    strokes = [arrange(polylines[index], reverse, vertex) for index, reverse, vertex in order_nearest_neighbour(polylines, start)]
+
+    if time_limit > 0:
+        improve_2opt(strokes, start, time_limit)
+
+    return strokes
+
+def join_polylines(polylines, tolerance):
+    """
+    Chain polylines whose endpoints are within [tolerance] of each other
+    into longer ones, reversing them where needed. Endpoints are found
+    through a hash of their position snapped to a [tolerance] grid.
+    """
+    tolerance = max(tolerance, 1e-9)
+    index = {}
+
+    def key(point):
+        return (int(math.floor(point[0] / tolerance)), int(math.floor(point[1] / tolerance)))
+
+    for i, points in enumerate(polylines):
+        if not is_closed(points):
+            index.setdefault(key(points[0]), []).append((i, False))
+            index.setdefault(key(points[-1]), []).append((i, True))
+
+    used = [False] * len(polylines)
+
+    def find(point):
+        """
+        Find an unused polyline with an end near [point]. Returns its index
+        and whether that end is its last point.
+        """
+        column, row = key(point)
+
+        for i in (column - 1, column, column + 1):
+            for j in (row - 1, row, row + 1):
+                for candidate, at_end in index.get((i, j), ()):
+                    if used[candidate]:
+                        continue
+
+                    points = polylines[candidate]
+
+                    if distance(point, points[-1] if at_end else points[0]) <= tolerance:
+                        return candidate, at_end
+
+        return None, None
+
+    def extend(chain, points):
+        if tuple(chain[-1]) == tuple(points[0]):
+            chain.extend(points[1:])
+        else:
+            chain.extend(points)
+
+    joined = []
+
+    for i, points in enumerate(polylines):
+        if used[i]:
+            continue
+
+        used[i] = True
+        chain = list(points)
+
+        if is_closed(chain):
+            joined.append(chain)
+            continue
+
+        # Grow forwards from the end, then backwards from the start
+        while True:
+            candidate, at_end = find(chain[-1])
+
+            if candidate is None:
+                break
+
+            used[candidate] = True
+            extend(chain, polylines[candidate][::-1] if at_end else polylines[candidate])
+
+        while True:
+            candidate, at_end = find(chain[0])
+
+            if candidate is None:
+                break
+
+            used[candidate] = True
+            head = list(polylines[candidate] if at_end else polylines[candidate][::-1])
+            extend(head, chain)
+            chain = head
+
+        joined.append(chain)
+
+    return joined
+
+def simplify_polyline(points, tolerance):
+    """
+    Simplify a polyline with the Ramer-Douglas-Peucker algorithm: keep
+    only the points needed for every dropped point to stay within
+    [tolerance] of the result. Endpoints are always kept, and kept points
+    are never moved.
+
+    Runs with an explicit stack. This is O(n log n) when the farthest
+    points split runs about evenly, and O(n^2) in the worst case, such as
+    spirals and zigzags where each split only peels off one point. Long
+    polylines use simplify_polyline_numpy() when NumPy is available.
+    """
+    n = len(points)
+
+    if n < 3:
+        return points
+
+    if numpy is not None and n > 64:
+        return simplify_polyline_numpy(points, tolerance)
+
+    tolerance2 = tolerance * tolerance
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+
+        if last - first < 2:
+            continue
+
+        ax, ay = points[first]
+        bx, by = points[last]
+        dx = bx - ax
+        dy = by - ay
+        length2 = dx * dx + dy * dy
+
+        farthest = first
+        farthest_distance2 = -1.0
+
+        for i in range(first + 1, last):
+            px, py = points[i]
+            ex = px - ax
+            ey = py - ay
+
+            if length2 > 0:
+                t = max(0.0, min(1.0, (ex * dx + ey * dy) / length2))
+                ex -= t * dx
+                ey -= t * dy
+
+            distance2 = ex * ex + ey * ey
+
+            if distance2 > farthest_distance2:
+                farthest = i
+                farthest_distance2 = distance2
+
+        if farthest_distance2 > tolerance2:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+def simplify_polyline_numpy(points, tolerance):
+    """
+    Same as simplify_polyline(), with the distances of each step computed
+    as one array operation.
+    """
+    if isinstance(points, PolylineView):
+        xy = numpy.frombuffer(points.get_coordinates(), dtype=float).reshape(-1, 2)
+    else:
+        xy = numpy.array(points, dtype=float)
+    n = len(xy)
+
+    tolerance2 = tolerance * tolerance
+    keep = numpy.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+
+        if last - first < 2:
+            continue
+
+        a = xy[first]
+        d = xy[last] - a
+        e = xy[first + 1:last] - a
+        length2 = d.dot(d)
+
+        if length2 > 0:
+            t = numpy.clip(e.dot(d) / length2, 0.0, 1.0)
+            e = e - t[:, numpy.newaxis] * d
+
+        distance2 = (e * e).sum(axis=1)
+        i = int(distance2.argmax())
+
+        if distance2[i] > tolerance2:
+            farthest = first + 1 + i
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [points[i] for i in numpy.flatnonzero(keep)]
+
+class LayerStage(object):
+    """
+    Base class for pipeline stages that work on all the polylines of a
+    layer at once.
+    """
+    def process_layer(self, polylines):
+        """
+        Return the polylines of one layer, transformed by this stage.
+        """
+        return polylines
+
+    def process_entities(self, entities):
+        """
+        Collect the paths between layer changes and yield them as one
+        processed path per layer. Other entities are passed through.
+        """
+        polylines = []
+
+        for entity in entities:
+            if isinstance(entity, SvgPath):
+                polylines.extend(entity.segments)
+                continue
+
+            if isinstance(entity, SvgLayerChange) and polylines:
+                yield SvgPath.from_geometry(None, self.process_layer(polylines))
+                polylines = []
+
+            yield entity
+
+        if polylines:
+            yield SvgPath.from_geometry(None, self.process_layer(polylines))
+
+class PolylineJoiner(LayerStage):
+    """
+    Pipeline stage that chains polylines of a layer which meet end to
+    end, so they are drawn without lifting the pen in between.
+    """
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.joins = 0
+
+    def process_layer(self, polylines):
+        polylines = [points for points in polylines if len(points)]
+        joined = join_polylines(polylines, self.tolerance)
+
+        self.joins += len(polylines) - len(joined)
+
+        return joined
+
+class TravelOptimizer(LayerStage):
+    """
+    Pipeline stage that reorders the polylines of each layer to reduce
+    pen-up travel, and keeps track of the travel before and after.
+    """
+    def __init__(self, time_limit=1.0):
+        self.time_limit = time_limit
+        self.position = (0.0, 0.0)
+        self.travel_before = 0.0
+        self.travel_after = 0.0
+
+    def process_layer(self, polylines):
+        """
+        Order the polylines of one layer, starting where the previous
+        layer ended.
+        """
+        polylines = [points for points in polylines if len(points)]
+
+        if not polylines:
+            return polylines
+
+        self.travel_before += travel_distance(polylines, self.position)
+
+        polylines = order_polylines(polylines, self.position, self.time_limit)
+
+        self.travel_after += travel_distance(polylines, self.position)
+        self.position = tuple(polylines[-1][-1])
+
+        return polylines
+
+class PolylineSimplifier(object):
+    """
+    Pipeline stage that simplifies the polylines of each path, and keeps
+    count of the points before and after.
+    """
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.points_before = 0
+        self.points_after = 0
+
+    def process_entities(self, entities):
+        for entity in entities:
+            if isinstance(entity, SvgPath):
+                segments = Polylines(simplify_polyline(points, self.tolerance) for points in entity.segments)
+
+                self.points_before += entity.segments.point_count()
+                self.points_after += segments.point_count()
+
+                entity.segments = segments
+
+            yield entity
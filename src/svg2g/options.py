@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+from svg2g.gcode import GCodeBuilder
+
+class Options(object):
+    """
+    Conversion options. Every option has a type, a default, a command
+    line flag and a description, and the command line options of svg2g
+    are made from these by add_options():
+
+        options = Options(scaling=0.2646, x_offset=30, paper_length=80)
+
+    Values are converted to the option's type, and unknown options are
+    an error. Boolean options take True or False, or one of the strings
+    in Options.booleans.
+    """
+    fields = [
+        ('x_offset', float, 64.0, '--xoffset',
+            'X Offset: Offset in mm between the paper cutter and where the paper should at the start of the writing process.'),
+        ('paper_length', float, 100.0, '--paper-length',
+            'Final length of the paper to be cut in mm'),
+        ('start_delay', float, 150.0, '--start-delay',
+            'Delay after pen down command before movement in milliseconds'),
+        ('stop_delay', float, 150.0, '--stop-delay',
+            'Delay after pen up command before movement in milliseconds'),
+        ('xy_feedrate', float, 3500.0, '--xy-feedrate',
+            'XY axes feedrate in millimeters per minute'),
+        ('homing_feedrate', float, 1000.0, '--homing-feedrate',
+            'Feedrate used when doing positioning movement'),
+        ('x_home', float, 0.0, '--x-home',
+            'Should be left as 0 for now'),
+        ('z_home', float, 0.0, '--z-home',
+            'Distance between the microswitch and where the paper cutter should end its movement'),
+        ('y_home', float, 0.0, '--y-home',
+            'Distance between the microswitch and the 0 point, which should be at the very edge of the paper'),
+        ('scaling', float, 1.0, '--scaling',
+            'svg scaling (defaut none!)'),
+        ('tolerance', float, None, '--tolerance',
+            'Curve flattening tolerance in output millimeters (default and minimum: the G-code resolution, %0.2f)' % GCodeBuilder.resolution),
+        ('flatten_backend', str, 'python', '--flatten-backend',
+            'Curve flattener: python (adaptive subdivision) or numpy (batched, requires NumPy; faster, but emits up to about twice as many points, which --simplify removes)'),
+        ('geometry_cache', int, 1000000, '--geometry-cache',
+            'Maximum number of points kept to reuse the geometry of clones and repeated paths (0 to disable)'),
+        ('jobs', int, 1, '--jobs',
+            'Number of processes parsing and flattening paths (0 for one per CPU)'),
+        ('stream_xml', bool, False, '--stream-xml',
+            'Read the SVG incrementally instead of loading the whole document (for very large files)'),
+        ('fit_arcs', bool, False, '--fit-arcs',
+            'Replace runs of points that lie on a circular arc with G2/G3 arcs'),
+        ('arc_tolerance', float, GCodeBuilder.resolution, '--arc-tolerance',
+            'Largest distance in millimeters between a point or chord and the arc replacing it'),
+        ('compact', bool, False, '--compact',
+            'Leave out trailing zeros, and words that repeat the current position or feedrate'),
+        ('strip_comments', bool, False, '--strip-comments',
+            'Leave comments and labels out of the GCode'),
+        ('simplify', float, 0.0, '--simplify',
+            'Drop polyline points that are within this distance in millimeters of the simplified line, on top of --tolerance (0 to disable)'),
+        ('join_polylines', bool, False, '--join-polylines',
+            'Draw polylines that meet end to end as one stroke, without lifting the pen'),
+        ('join_tolerance', float, GCodeBuilder.resolution, '--join-tolerance',
+            'Distance in millimeters under which polyline ends are considered to meet'),
+        ('optimize_travel', bool, False, '--optimize-travel',
+            'Reorder (and reverse) the polylines of each layer to reduce pen-up travel'),
+        ('optimize_time', float, 1.0, '--optimize-time',
+            'Time in seconds spent improving the order of each layer after the nearest neighbour pass')
+    ]
+
+    # Values allowed for options that are a choice
+    choices = {
+        'flatten_backend': ('python', 'numpy')
+    }
+
+    # Strings accepted for boolean options
+    booleans = {
+        'true': True,
+        '1': True,
+        'false': False,
+        '0': False
+    }
+
+    # optparse types of the option types
+    option_types = {
+        float: 'float',
+        int: 'int',
+        str: 'string'
+    }
+
+    def __init__(self, **kwargs):
+        for name, kind, default, _, _ in Options.fields:
+            value = kwargs.pop(name, default)
+
+            if value is None:
+                pass
+            elif kind is bool:
+                value = Options.parse_bool(name, value)
+            else:
+                value = kind(value)
+
+            setattr(self, name, value)
+
+        if kwargs:
+            raise TypeError('unknown options: %s' % ', '.join(sorted(kwargs)))
+
+        for name, values in Options.choices.items():
+            if getattr(self, name) not in values:
+                raise ValueError('%s must be one of %s' % (name, ', '.join(values)))
+
+    @classmethod
+    def parse_bool(cls, name, value):
+        """
+        Return the boolean [value] of option [name], given as a bool or
+        as one of the strings in booleans (in any case).
+        """
+        if isinstance(value, bool):
+            return value
+
+        if isinstance(value, basestring) and value.lower() in cls.booleans:
+            return cls.booleans[value.lower()]
+
+        raise ValueError('%s must be true or false, not %r' % (name, value))
+
+    @classmethod
+    def add_options(cls, parser):
+        """
+        Add a command line option for every field to the optparse
+        [parser], with the field's type and default.
+        """
+        for name, kind, default, flag, description in cls.fields:
+            if kind is bool:
+                parser.add_option(flag,
+                    action='store_true',
+                    dest=name,
+                    default=default,
+                    help=description)
+            elif name in cls.choices:
+                parser.add_option(flag,
+                    action='store',
+                    type='choice',
+                    choices=list(cls.choices[name]),
+                    dest=name,
+                    default=default,
+                    help=description)
+            else:
+                parser.add_option(flag,
+                    action='store',
+                    type=cls.option_types[kind],
+                    dest=name,
+                    default=default,
+                    help=description)
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Make options from the attributes of an object such as optparse's
+        Values, ignoring those that are not conversion options.
+        """
+        return cls(**dict((name, getattr(values, name)) for name, _, _, _, _ in cls.fields if hasattr(values, name)))
+
+    def __repr__(self):
+        return 'Options(%s)' % ', '.join('%s=%r' % (name, getattr(self, name)) for name, _, _, _, _ in Options.fields)
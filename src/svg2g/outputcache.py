@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+import errno
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+import svg2g
+
+class OutputCache(object):
+    """
+    On-disk cache of converted GCode, keyed by a hash of the input bytes,
+    the options and the converter version.
+
+    Entries are gzipped files named after their key. A hit touches its
+    file, and files are evicted by age once the cache is over
+    [max_size] bytes, so the least recently used go first. Entries are
+    written to a temporary file and renamed into place, so processes
+    sharing the cache never read a partial entry.
+
+    This module does not import lxml: a hit is streamed out before any
+    parsing code is loaded.
+    """
+    # Size of the blocks read and written
+    block_size = 65536
+
+    suffix = '.gcode.gz'
+
+    # Digest of the converter's source files, computed once
+    source_digest = None
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def get_version(cls):
+        """
+        Get the converter version: the package version and a digest of
+        its source, so output is never reused across code changes.
+        """
+        if cls.source_digest is None:
+            digest = hashlib.sha1()
+            base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+            for package in ('svg2g', 'lib'):
+                directory = os.path.join(base, package)
+
+                for name in sorted(os.listdir(directory)):
+                    if name.endswith('.py'):
+                        digest.update(name.encode('utf-8'))
+
+                        with open(os.path.join(directory, name), 'rb') as source:
+                            digest.update(source.read())
+
+            cls.source_digest = digest.hexdigest()
+
+        return '%s-%s' % (svg2g.__version__, cls.source_digest)
+
+    def make_key(self, stream, options):
+        """
+        Hash the input [stream] and the [options] dict into a key. Returns
+        the key and a stream positioned at the start of the input: the
+        same one if it can be rewound, otherwise a temporary copy.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps([self.get_version(), sorted(options.items())]).encode('utf-8'))
+
+        try:
+            position = stream.tell()
+            stream.seek(position)
+            copy = None
+        except (AttributeError, IOError):
+            copy = tempfile.TemporaryFile()
+
+        while True:
+            block = stream.read(OutputCache.block_size)
+
+            if not block:
+                break
+
+            digest.update(block)
+
+            if copy is not None:
+                copy.write(block)
+
+        if copy is None:
+            stream.seek(position)
+        else:
+            copy.seek(0)
+            stream = copy
+
+        return digest.hexdigest(), stream
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + OutputCache.suffix)
+
+    def get(self, key):
+        """
+        Get an iterator over the GCode stored for [key], or None.
+        """
+        path = self.get_path(key)
+
+        try:
+            entry = gzip.open(path, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+
+            raise
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return self.read_entry(entry)
+
+    def read_entry(self, entry):
+        try:
+            while True:
+                block = entry.read(OutputCache.block_size)
+
+                if not block:
+                    break
+
+                yield block
+        finally:
+            entry.close()
+
+    def put(self, key, chunks):
+        """
+        Pass the GCode [chunks] through while storing them for [key]. The
+        entry is only added once the chunks are exhausted without error.
+        """
+        fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        stored = False
+
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                entry = gzip.GzipFile(fileobj=output, mode='wb', compresslevel=6)
+
+                for chunk in chunks:
+                    entry.write(chunk)
+
+                    yield chunk
+
+                entry.close()
+
+            os.rename(temporary, self.get_path(key))
+            stored = True
+        finally:
+            if not stored:
+                os.remove(temporary)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size bytes.
+        """
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(OutputCache.suffix):
+                continue
+
+            path = os.path.join(self.directory, name)
+
+            try:
+                status = os.stat(path)
+            except OSError:
+                # Evicted by another process
+                continue
+
+            entries.append((status.st_mtime, status.st_size, path))
+            total += status.st_size
+
+        entries.sort()
+
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+
+import errno
+import io
+import json
+import multiprocessing
+import optparse
+import os
+import select
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+from svg2g import client
+from svg2g.api import Converter
+from svg2g.cache import LRUCache
+from svg2g.options import Options
+
+class RequestTimeout(Exception):
+    pass
+
+class Svg2GServer(object):
+    """
+    Conversion daemon: a master process listening on a Unix socket and a
+    fixed number of preforked worker processes accepting requests on it.
+    Workers keep their converters, and so their geometry caches, from one
+    request to the next. A request that times out is abandoned wherever
+    it was, possibly half way through updating a cache, so the worker
+    exits once it has replied and the master starts a fresh one.
+
+    The master replaces workers that exit. On SIGHUP it asks the workers
+    to finish their current request and exit, then re-executes itself
+    with the same listening socket, so new code is loaded without
+    refusing connections. SIGTERM and SIGINT stop the server the same
+    way.
+    """
+    # Environment variable passing the listening socket to the new
+    # master on reload
+    listener_variable = 'SVG2G_LISTENER_FD'
+
+    # Seconds between checks for signals and exited workers
+    poll_interval = 0.5
+
+    def __init__(self, argv=None):
+        if argv is None:
+            argv = sys.argv[1:]
+
+        self.get_options(argv)
+
+        self.workers = set()
+        self.running = False
+        self.reloading = False
+        self.stopping = False
+
+    def get_options(self, argv):
+        """
+        Get options from the command line.
+        """
+        self.OptionParser = optparse.OptionParser(usage='usage: %prog serve [options]')
+
+        self.OptionParser.add_option('--socket',
+            action='store',
+            type='string',
+            dest='socket',
+            default=os.path.join(tempfile.gettempdir(), 'svg2g.sock'),
+            help='Path of the Unix socket to listen on')
+
+        self.OptionParser.add_option('--workers',
+            action='store',
+            type='int',
+            dest='workers',
+            default='0',
+            help='Number of worker processes (0 for one per CPU)')
+
+        self.OptionParser.add_option('--timeout',
+            action='store',
+            type='float',
+            dest='timeout',
+            default='60.0',
+            help='Time in seconds a request may take before it is abandoned')
+
+        self.OptionParser.add_option('--converters',
+            action='store',
+            type='int',
+            dest='converters',
+            default='4',
+            help='Number of option sets each worker keeps a warm converter for')
+
+        self.options, self.args = self.OptionParser.parse_args(argv)
+
+        if self.options.workers <= 0:
+            self.options.workers = multiprocessing.cpu_count()
+
+    def log(self, message):
+        sys.stderr.write('svg2g serve [%i]: %s\n' % (os.getpid(), message))
+
+    def get_listener(self):
+        """
+        Get the listening socket, from the previous master on reload or
+        bound to the socket path.
+        """
+        fd = os.environ.pop(Svg2GServer.listener_variable, None)
+
+        if fd is not None:
+            listener = socket.fromfd(int(fd), socket.AF_UNIX, socket.SOCK_STREAM)
+            os.close(int(fd))
+
+            return listener
+
+        path = self.options.socket
+
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(path)
+            except socket.error:
+                # Left over by a server that did not exit cleanly
+                os.unlink(path)
+            else:
+                raise SystemExit('svg2g serve: a server is already listening on %s' % path)
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(128)
+
+        return listener
+
+    def run(self):
+        """
+        Start the workers and supervise them until stopped.
+        """
+        self.listener = self.get_listener()
+        self.listener.setblocking(False)
+        self.running = True
+
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+
+        self.log('listening on %s with %i workers' % (self.options.socket, self.options.workers))
+
+        while self.running:
+            if self.reloading:
+                self.reload()
+
+            self.reap()
+
+            while len(self.workers) < self.options.workers:
+                self.spawn()
+
+            time.sleep(Svg2GServer.poll_interval)
+
+        self.stop()
+
+    def on_stop(self, signum, frame):
+        self.running = False
+
+    def on_reload(self, signum, frame):
+        self.reloading = True
+
+    def reap(self, block=False):
+        """
+        Collect exited workers, including those of a previous master.
+        """
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+
+                if e.errno == errno.ECHILD:
+                    return
+
+                raise
+
+            if pid == 0:
+                return
+
+            self.workers.discard(pid)
+
+    def signal_workers(self):
+        """
+        Ask every worker to exit once its current request is done.
+        """
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def reload(self):
+        """
+        Replace this master, and through it the workers, by a fresh
+        process running the current code on the same socket.
+        """
+        self.log('reloading')
+        self.signal_workers()
+
+        fd = self.listener.fileno()
+
+        if hasattr(os, 'set_inheritable'):
+            os.set_inheritable(fd, True)
+
+        os.environ[Svg2GServer.listener_variable] = str(fd)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def stop(self):
+        self.log('stopping')
+        self.signal_workers()
+        self.reap(block=True)
+        self.listener.close()
+
+        if os.path.exists(self.options.socket):
+            os.unlink(self.options.socket)
+
+    def spawn(self):
+        pid = os.fork()
+
+        if pid:
+            self.workers.add(pid)
+            return
+
+        status = 0
+
+        try:
+            self.work()
+        except:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def work(self):
+        """
+        Accept and handle requests until asked to stop.
+        """
+        signal.signal(signal.SIGTERM, self.on_worker_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGALRM, self.on_timeout)
+
+        self.converters = LRUCache(self.options.converters)
+        self.timed_out = False
+        self.sending = False
+
+        while not self.stopping:
+            try:
+                readable, _, _ = select.select([self.listener], [], [], Svg2GServer.poll_interval)
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+
+                raise
+
+            if not readable:
+                continue
+
+            try:
+                connection, _ = self.listener.accept()
+            except socket.error as e:
+                # Another worker took it
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
+
+                raise
+
+            try:
+                self.handle(connection)
+            finally:
+                connection.close()
+
+    def on_worker_stop(self, signum, frame):
+        self.stopping = True
+
+    def on_timeout(self, signum, frame):
+        self.timed_out = True
+
+        # A frame cut short would garble the rest of the reply, so
+        # send_data() raises once it has sent it
+        if not self.sending:
+            raise RequestTimeout()
+
+    def get_converter(self, options):
+        """
+        Get the converter for a set of options, reusing a warm one if the
+        same options were used recently.
+        """
+        key = tuple(sorted(vars(options).items()))
+        converter = self.converters.get(key)
+
+        if converter is None:
+            converter = Converter(options)
+            self.converters.put(key, converter)
+
+        return converter
+
+    def read_request(self, connection):
+        """
+        Read a request: a line of JSON options, then the SVG up to the
+        end of the stream. Conversions run in the worker itself, so jobs
+        is always 1.
+        """
+        data = []
+
+        while True:
+            chunk = client.receive(connection, 65536)
+
+            if not chunk:
+                break
+
+            data.append(chunk)
+
+        header, _, source = b''.join(data).partition(b'\n')
+
+        fields = json.loads(header.decode('utf-8'))
+        fields['jobs'] = 1
+
+        return Options(**dict((str(name), value) for name, value in fields.items())), source
+
+    def send_data(self, connection, chunk):
+        """
+        Send a chunk of GCode, then give up on the request if it timed
+        out meanwhile.
+        """
+        self.sending = True
+
+        try:
+            client.send_frame(connection, client.DATA, chunk)
+        finally:
+            self.sending = False
+
+        if self.timed_out:
+            raise RequestTimeout()
+
+    def handle(self, connection):
+        """
+        Convert one request, streaming the GCode back as it is generated,
+        then the warnings and reports, then the outcome.
+        """
+        connection.setblocking(True)
+        connection.settimeout(self.options.timeout)
+
+        messages = io.BytesIO()
+        error = None
+
+        try:
+            signal.setitimer(signal.ITIMER_REAL, self.options.timeout)
+
+            try:
+                options, source = self.read_request(connection)
+
+                for chunk in self.get_converter(options).convert(source, messages=messages):
+                    self.send_data(connection, chunk)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except RequestTimeout:
+            error = 'request timed out after %gs' % self.options.timeout
+        except Exception as e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+
+        if error is not None:
+            self.log(error)
+
+        try:
+            if messages.getvalue():
+                client.send_frame(connection, client.MESSAGES, messages.getvalue())
+
+            if error is None:
+                client.send_frame(connection, client.DONE)
+            else:
+                client.send_frame(connection, client.ERROR, error.encode('utf-8'))
+        except socket.error:
+            pass
+
+        if self.timed_out:
+            self.log('exiting to be replaced after the timeout')
+            self.stopping = True
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import json
+
+try:
+    from time import monotonic as clock
+except ImportError:
+    # Python 2
+    from time import time as clock
+
+class Stats(object):
+    """
+    Time spent in each stage of a conversion and counters of the work
+    done, for --profile and --stats.
+
+    Stages nest: time is charged to the innermost stage running, so the
+    times of a generator pipeline, where every stage pulls from the one
+    before it, add up to the total instead of overlapping. Code that
+    collects statistics takes a Stats or None, and does nothing more than
+    test for None when they are not wanted.
+
+    This module does not import lxml.
+    """
+    # Stages and counters in report order, with their descriptions
+    stage_names = [
+        ('load', 'load converter'),
+        ('parse_xml', 'parse XML'),
+        ('traverse', 'traverse document'),
+        ('entities', 'build entities'),
+        ('flatten', 'flatten curves'),
+        ('simplify', 'simplify polylines'),
+        ('join', 'join polylines'),
+        ('optimize_travel', 'optimize travel'),
+        ('gcode', 'build GCode'),
+        ('server', 'convert on server')
+    ]
+
+    counter_names = [
+        ('nodes', 'nodes visited'),
+        ('curves', 'curves subdivided'),
+        ('points', 'points emitted'),
+        ('pen_lifts', 'pen lifts'),
+        ('output_bytes', 'output bytes'),
+        ('cache_hits', 'output cache hits')
+    ]
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.stages = []
+        self.started = clock()
+        self.mark = self.started
+
+    def charge(self):
+        """
+        Charge the time since the last change of stage to the current
+        stage.
+        """
+        now = clock()
+
+        if self.stages:
+            stage = self.stages[-1]
+            self.times[stage] = self.times.get(stage, 0.0) + now - self.mark
+
+        self.mark = now
+
+    def start(self, stage):
+        self.charge()
+        self.stages.append(stage)
+
+    def stop(self):
+        self.charge()
+        self.stages.pop()
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge(self, counts):
+        """
+        Add counters collected elsewhere, such as in a worker process.
+        """
+        for name, value in counts.items():
+            self.count(name, value)
+
+    def iterate(self, stage, iterable):
+        """
+        Yield the items of [iterable], charging the time spent getting
+        each one to [stage].
+        """
+        iterator = iter(iterable)
+        done = object()
+
+        while True:
+            self.start(stage)
+            item = next(iterator, done)
+            self.stop()
+
+            if item is done:
+                return
+
+            yield item
+
+    def get_report(self):
+        """
+        Get the times, in seconds, and counters as a dict.
+        """
+        return {
+            'total': clock() - self.started,
+            'times': dict(self.times),
+            'counts': dict(self.counts)
+        }
+
+    def write_json(self, output):
+        json.dump(self.get_report(), output, indent=2, separators=(',', ': '), sort_keys=True)
+        output.write('\n')
+
+    def describe_counter(self, name):
+        """
+        Describe a counter not in counter_names, such as the number of
+        elements of one type ('elements.path').
+        """
+        if name.startswith('elements.'):
+            return '<%s> elements' % name.partition('.')[2]
+
+        return name.replace('_', ' ')
+
+    def write_report(self, output):
+        """
+        Write the report as text, stages then counters, leaving out those
+        that never ran.
+        """
+        report = self.get_report()
+        lines = ['Conversion statistics:']
+
+        stage_names = Stats.stage_names + [(name, name) for name in sorted(self.times) if name not in dict(Stats.stage_names)]
+
+        for name, description in stage_names:
+            if name in self.times:
+                lines.append('  %-24s %9.3fs' % (description, self.times[name]))
+
+        lines.append('  %-24s %9.3fs' % ('total', report['total']))
+
+        counter_names = Stats.counter_names + [(name, self.describe_counter(name)) for name in sorted(self.counts) if name not in dict(Stats.counter_names)]
+
+        for name, description in counter_names:
+            if name in self.counts:
+                lines.append('  %-24s %10i' % (description, self.counts[name]))
+
+        output.write('\n'.join(lines) + '\n')
@@ -1,18 +1,38 @@
 #!/usr/bin/env python
 
+import copy
+import math
+import multiprocessing
+import shutil
+import tempfile
+
 from lxml import etree
 
-from lib import bezmisc 
 from lib import cubicsuperpath
-from lib import ffgeom
 from lib import inkex
 from lib import simplepath
-from lib import simpletransform
+from svg2g import flatten
+from svg2g import transform
+from svg2g.geometry import Polylines
+from svg2g.stats import Stats
+
+def write_message(messages, message):
+    """
+    Write a warning or report, as inkex.errormsg does, to the file object
+    [messages], or nowhere if it is None.
+    """
+    if messages is not None:
+        messages.write((unicode(message) + '\n').encode('UTF-8'))
 
 class SvgEntity(object):
     """
     Base class for SVG entities.
+
+    Entities use __slots__, as large documents keep many of them alive at
+    once.
     """
+    __slots__ = ()
+
     def __init__(self, node, node_transform):
         pass
 
@@ -20,14 +40,25 @@ class SvgIgnored(SvgEntity):
     """
     An SVG entity which will not be rendered.
     """
+    __slots__ = ('tag',)
+
     def __init__(self, node, node_transform):
         self.tag = node.tag
     
 class SvgPath(SvgEntity):
     """
     An SVG entity which will render a segmented line.
+
+    Its segments are held in a Polylines buffer once flattened. With the
+    python backend, paths are made by from_path_data, which never builds
+    the CubicSuperPath.
     """
+    __slots__ = ('segments', 'cubic_path')
+
     def __init__(self, node, node_transform):
+        self.segments = Polylines()
+        self.cubic_path = []
+
         d = node.get('d')
 
         path = simplepath.parsePath(d)
@@ -36,222 +67,291 @@ class SvgPath(SvgEntity):
             return
         
         path = cubicsuperpath.CubicSuperPath(path)
-        simpletransform.applyTransformToPath(node_transform, path)
+        transform.apply_to_path(node_transform, path)
 
         # path is now a list of lists of cubic beziers [ctrl p1, ctrl p2, endpoint]
         # where the start-point is the endpoint of the previous segment
-        self.segments = []
-        
-        for cubic_bezier_path in path:
-            points = []
-            
-            self._subdivide_cubic_bezier_path(cubic_bezier_path, 0.01)    # TODO: smoothness preference
+        self.cubic_path = path
 
-            for p1, p2, endpoint in cubic_bezier_path:
-                points.append(p2)
-            
-            self.segments.append(points)
+    @classmethod
+    def from_path_data(cls, d, node_transform, flat, stats=None):
+        """
+        Make a flattened path entity from path data, without building
+        its CubicSuperPath.
+        """
+        path = simplepath.parsePath(d)
+
+        if stats is not None:
+            stats.start('flatten')
 
-    def _compute_max_distance(self, points):
+        entity = cls.from_geometry(None, flatten.flatten_path(path, node_transform, flat, stats))
+
+        if stats is not None:
+            stats.stop()
+
+        return entity
+
+    @classmethod
+    def from_geometry(cls, cubic_path, segments=None):
+        """
+        Make a path entity from an already transformed CubicSuperPath, or
+        from already flattened segments.
+        """
+        entity = cls.__new__(cls)
+        entity.cubic_path = cubic_path
+
+        if not isinstance(segments, Polylines):
+            segments = Polylines(segments or [])
+
+        entity.segments = segments
+
+        return entity
+
+    def flatten(self, flat):
         """
-        Compute the max distance between four points.
+        Flatten the path into polylines (self.segments), each within
+        [flat] of the original curves.
         """
-        ((p0x, p0y), (p1x, p1y), (p2x, p2y), (p3x, p3y)) = points
+        self.segments = Polylines()
 
-        p0 = ffgeom.Point(p0x, p0y)
-        p1 = ffgeom.Point(p1x, p1y)
-        p2 = ffgeom.Point(p2x, p2y)
-        p3 = ffgeom.Point(p3x, p3y)
+        for cubic_bezier_path in self.cubic_path:
+            points = self._subdivide_cubic_bezier_path(cubic_bezier_path, flat)
 
-        s1 = ffgeom.Segment(p0, p3)
+            self.segments.append(points)
 
-        return max(s1.distanceToPoint(p1), s1.distanceToPoint(p2))
+        self.cubic_path = None
 
     def _subdivide_cubic_bezier_path(self, cubic_bezier_path, flat):
         """
         Break up a bezier curve into smaller curves, each of which
         is approximately a straight line within a given tolerance
-        (the "smoothness" defined by [flat]).
+        (the "smoothness" defined by [flat]), and return the points
+        of the resulting polyline.
 
         This is a modified version of Inkscape's cspsubdiv.cspsubdiv().
         The recursive call has been rewritten because it caused
-        recursion-depth errors on complicated line segments.
+        recursion-depth errors on complicated line segments, and the
+        points are collected into a new list rather than spliced into
+        [cubic_bezier_path], which was quadratic on long paths.
         """
-        i = 1
-
-        while True:
-            while True:
-                if i >= len(cubic_bezier_path):
-                    return
-
-                # First bezier, first control point 
-                p0 = cubic_bezier_path[i - 1][1]
-
-                # First bezier, endpoint
-                p1 = cubic_bezier_path[i - 1][2]
-
-                # Second bezier, Second control point
-                p2 = cubic_bezier_path[i][0]
+        return flatten.flatten_cubic_superpath(cubic_bezier_path, flat)
 
-                # Second bezier, first control point
-                p3 = cubic_bezier_path[i][1]
-
-                b = (p0, p1, p2, p3)
-
-                if self._compute_max_distance(b) > flat:
-                    break
+class SvgPrimitive(SvgPath):
+    """
+    Base class for basic shapes, which are polygonized directly from their
+    attributes rather than being converted to path data and re-parsed.
+    """
+    __slots__ = ('node_transform', 'polylines')
 
-                i += 1
+    def __init__(self, node, node_transform):
+        self.segments = Polylines()
+        self.cubic_path = []
+        self.node_transform = node_transform
+        self.polylines = self.make_polylines(node)
 
-            one, two = bezmisc.beziersplitatt(b, 0.5)
-            cubic_bezier_path[i - 1][2] = one[1]
-            cubic_bezier_path[i][0] = two[2]
-            p = [one[2], one[3], two[1]]
-            cubic_bezier_path[i:1] = [p]
+    def make_polylines(self, node):
+        """
+        Return the shape as a list of polylines in local coordinates.
+        """
+        return []
 
-    def new_path_from_node(self, node):
-        newpath = etree.Element(inkex.addNS('path', 'svg'))
+    def transform_points(self, points):
+        """
+        Apply the node transform to a list of (x, y) points.
+        """
+        return transform.apply_to_points(self.node_transform, points)
 
-        node_style = node.get('style')
-        
-        if node_style:
-            newpath.set('style', node_style)
-        
-        transform = node.get('transform')
-        
-        if transform:
-            newpath.set('transform', transform)
-        
-        return newpath
+    def flatten(self, flat):
+        """
+        Transform the polylines to output coordinates. They are already
+        straight, so [flat] is not needed.
+        """
+        self.segments = Polylines(self.transform_points(points) for points in self.polylines)
+        self.polylines = None
 
-class SvgRect(SvgPath):
+class SvgRect(SvgPrimitive):
     """
     An SVG entity will render a rectangle.
     """
-    def __init__(self, node, node_transform):
-        newpath = self.new_path_from_node(node)
+    __slots__ = ()
 
-        x = float(node.get('x'))
-        y = float(node.get('y'))
+    def make_polylines(self, node):
+        x = float(node.get('x', '0'))
+        y = float(node.get('y', '0'))
         w = float(node.get('width'))
         h = float(node.get('height'))
 
-        a = []
-        a.append(['M ', [x, y]])
-        a.append([' l ', [w, 0]])
-        a.append([' l ', [0, h]])
-        a.append([' l ', [-w, 0]])
-        a.append([' Z', []])
-
-        newpath.set('d', simplepath.formatPath(a))
-        
-        SvgPath.__init__(self, newpath, node_transform)
+        return [[(x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)]]
 
-class SvgLine(SvgPath):
+class SvgLine(SvgPrimitive):
     """
     An SVG entity that renders a line.
     """
-    def __init__(self, node, node_transform):
-        newpath = self.new_path_from_node(node)
-
-        x1 = float(node.get('x1'))
-        y1 = float(node.get('y1'))
-        x2 = float(node.get('x2'))
-        y2 = float(node.get('y2'))
+    __slots__ = ()
 
-        a = []
-        a.append(['M ', [x1, y1]])
-        a.append([' L ', [x2, y2]])
+    def make_polylines(self, node):
+        x1 = float(node.get('x1', '0'))
+        y1 = float(node.get('y1', '0'))
+        x2 = float(node.get('x2', '0'))
+        y2 = float(node.get('y2', '0'))
 
-        newpath.set('d', simplepath.formatPath(a))
-        
-        SvgPath.__init__(self, newpath, node_transform)
+        return [[(x1, y1), (x2, y2)]]
 
-class SvgPolyLine(SvgPath):
+class SvgPolyLine(SvgPrimitive):
     """
     An SVG entity that renders as a segmented line.
     """
-    def __init__(self, node, node_transform):
-        newpath = self.new_path_from_node(node)
-        pl = node.get('points', '').strip()
+    __slots__ = ()
 
-        if pl == '':
-            return
-        
-        pa = pl.split()
-        
-        if not len(pa):
-            return
+    closed = False
 
-        d = "M " + pa[0]
-        
-        for i in range(1, len(pa)):
-            d += " L " + pa[i]
-        
-        newpath.set('d', d)
-        
-        SvgPath.__init__(self, newpath, node_transform)
+    def make_polylines(self, node):
+        coordinates = node.get('points', '').replace(',', ' ').split()
+
+        if len(coordinates) < 2:
+            return []
+
+        values = [float(c) for c in coordinates]
+        points = list(zip(values[0::2], values[1::2]))
 
-class SvgEllipse(SvgPath):
+        if self.closed:
+            points.append(points[0])
+
+        return [points]
+
+class SvgPolygon(SvgPolyLine):
+    """
+    An SVG entity that renders as a closed segmented line.
+    """
+    __slots__ = ()
+
+    closed = True
+
+class SvgEllipse(SvgPrimitive):
     """
     An SVG entity that renders an ellipse.
     """
+    __slots__ = ('cx', 'cy', 'rx', 'ry')
+
     def __init__(self, node, node_transform):
-        rx = float(node.get('rx', '0'))
-        ry = float(node.get('ry', '0'))
+        self.segments = Polylines()
+        self.cubic_path = []
+        self.node_transform = node_transform
+        self.polylines = None
 
-        newpath = self.make_ellipse_path(rx, ry, node)
-        
-        SvgPath.__init__(self, newpath, node_transform)
+        self.cx = float(node.get('cx', '0'))
+        self.cy = float(node.get('cy', '0'))
+        self.rx, self.ry = self.get_radii(node)
 
-    def make_ellipse_path(self, rx, ry, node):
-        if rx == 0 or ry == 0:
-            return None
-        
-        cx = float(node.get('cx', '0'))
-        cy = float(node.get('cy', '0'))
+    def get_radii(self, node):
+        return float(node.get('rx', '0')), float(node.get('ry', '0'))
+
+    def get_segment_count(self, flat):
+        """
+        Number of chords needed to keep the polygon within [flat] of the
+        ellipse in output coordinates.
+
+        A chord spanning an angle step of t on a circle of radius r
+        deviates from it by r * (1 - cos(t / 2)). The ellipse is the
+        unit circle scaled by the node transform, so r is the largest
+        singular value of that linear map.
+        """
+        a, b, c, d, e, f = self.node_transform
+
+        a, b, c, d = a * self.rx, b * self.rx, c * self.ry, d * self.ry
+
+        s = a * a + b * b + c * c + d * d
+        det = a * d - b * c
+        radius = math.sqrt((s + math.sqrt(max(s * s - 4 * det * det, 0.0))) / 2)
+
+        if flat >= radius:
+            return 4
 
-        x1 = cx - rx
-        x2 = cx + rx
+        step = 2 * math.acos(1 - flat / radius)
 
-        d = 'M %f,%f ' % (x1, cy) + \
-            'A %f,%f ' % (rx, ry) + \
-            '0 1 0 %f, %f ' % (x2, cy) + \
-            'A %f,%f ' % (rx, ry) + \
-            '0 1 0 %f,%f' % (x1, cy)
+        return max(int(math.ceil(2 * math.pi / step)), 4)
 
-        newpath = self.new_path_from_node(node)
-        newpath.set('d', d)
+    def flatten(self, flat):
+        """
+        Polygonize the ellipse with the fewest chords that stay within
+        [flat], starting at (cx - rx, cy) and running in the same
+        direction as the old arc-based outline.
+        """
+        if self.rx == 0 or self.ry == 0:
+            return
+
+        n = self.get_segment_count(flat)
+        step = 2 * math.pi / n
+
+        points = [(self.cx - self.rx, self.cy)]
 
-        return newpath
+        for i in range(1, n):
+            angle = math.pi - i * step
+            points.append((self.cx + self.rx * math.cos(angle), self.cy + self.ry * math.sin(angle)))
+
+        points.append(points[0])
+
+        self.segments = Polylines([self.transform_points(points)])
     
 class SvgCircle(SvgEllipse):
     """
     An SVG entity that renders as an ellipse.
     """
-    def __init__(self, node, node_transform):
-        rx = float(node.get('r', '0'))
+    __slots__ = ()
 
-        newpath = self.make_ellipse_path(rx, rx, node)
+    def get_radii(self, node):
+        r = float(node.get('r', '0'))
 
-        SvgPath.__init__(self, newpath, node_transform)
+        return r, r
 
 class SvgText(SvgIgnored):
     """
     An SVG entity that renders as text.
     """
-    def __init__(self, node, node_transform):
-        inkex.errormsg('Warning: unable to draw text. please convert it to a path first.')
+    __slots__ = ()
 
+    def __init__(self, node, node_transform):
         SvgIgnored.__init__(self, node, node_transform)
     
 class SvgLayerChange(SvgEntity):
     """
     An SVG entity that stands in for a delay between layer changes.
     """
+    __slots__ = ('layer_name',)
+
     def __init__(self, layer_name):
         self.layer_name = layer_name
 
+def flatten_path_chunk(args):
+    """
+    Parse, transform and flatten a chunk of (d, node_transform) path
+    data, the same way as SvgPath does. Runs in the worker processes of
+    SvgParser's pool; returns one Polylines per path, and the counters
+    collected if [counting].
+    """
+    items, flat, flatten_backend, counting = args
+    stats = Stats() if counting else None
+    paths = []
+
+    if flatten_backend != 'numpy':
+        results = [flatten.flatten_path(simplepath.parsePath(d), node_transform, flat, stats) for d, node_transform in items]
+
+        return results, stats and stats.counts
+
+    for d, node_transform in items:
+        path = simplepath.parsePath(d)
+
+        if len(path) > 0:
+            path = cubicsuperpath.CubicSuperPath(path)
+            transform.apply_to_path(node_transform, path)
+
+            if stats is not None:
+                stats.count('curves', flatten.count_curves(path))
+
+        paths.append(path)
+
+    return [Polylines(segments) for segments in flatten.flatten_batch(paths, flat)], stats and stats.counts
+
 class SvgParser(object):
     """
     Parses an SVG.
@@ -261,7 +361,7 @@ class SvgParser(object):
         'rect': SvgRect,
         'line': SvgLine,
         'polyline': SvgPolyLine,
-        'polygon': SvgPolyLine,
+        'polygon': SvgPolygon,
         'circle': SvgCircle,
         'ellipse': SvgEllipse,
         'pattern': SvgIgnored,
@@ -272,10 +372,89 @@ class SvgParser(object):
         'text': SvgText
     }
 
-    def __init__(self, svg, scale=1.0):
+    # Number of paths flattened together by the numpy backend or the
+    # process pool
+    batch_size = 10000
+
+    # Chunks of work handed to each process of the pool per batch
+    chunks_per_job = 4
+
+    group_tags = (inkex.addNS('g', 'svg'), 'g')
+    use_tags = (inkex.addNS('use', 'svg'), 'use')
+    groupmode_attribute = inkex.addNS('groupmode', 'inkscape')
+    label_attribute = inkex.addNS('label', 'inkscape')
+    href_attribute = inkex.addNS('href', 'xlink')
+
+    def __init__(self, svg, scale=1.0, tolerance=0.01, flatten_backend='python', geometry_cache=None, jobs=1, fragment_cache=None, stats=None, messages=None):
         self.svg = svg
         self.entities = []
         self.scale = scale
+        # Paths are flattened after node_transform is applied, so this is
+        # in output units (mm with the launcher's scaling)
+        self.flat = tolerance
+        self.flatten_backend = flatten_backend
+        self.unflattened = []
+        self.geometry_cache = geometry_cache
+        # Paths are parsed and flattened by a pool of [jobs] processes
+        # when above 1
+        self.jobs = jobs
+        self.pool = None
+        self.unparsed = []
+        # Flattened polylines of elements from previous conversions
+        self.fragment_cache = fragment_cache
+        self.unstored = []
+        # Stats of the conversion, or None
+        self.stats = stats
+        # File object warnings are written to, or None
+        self.messages = messages
+        self.tag_map = self.make_tag_map()
+        # Memo of parsed transform attributes, kept for this parser only
+        self.parsed_transforms = {}
+        self.id_index = None
+        self.pending_uses = None
+
+        if flatten_backend == 'numpy' and flatten.numpy is None:
+            self.warn('Warning: NumPy is not available, falling back to the python flattener.')
+            self.flatten_backend = 'python'
+
+    def warn(self, message):
+        write_message(self.messages, message)
+
+    def make_tag_map(self):
+        """
+        Map every tag in entity_map, with and without its namespace, to
+        its entity class.
+        """
+        tag_map = {}
+
+        for nodetype, cls in SvgParser.entity_map.items():
+            tag = nodetype
+            ns = 'svg'
+            
+            if type(tag) is tuple:
+                tag = nodetype[0]
+                ns = nodetype[1]
+
+            tag_map[tag] = cls
+            tag_map[inkex.addNS(tag, ns)] = cls
+
+        return tag_map
+
+    def get_element_by_id(self, element_id):
+        """
+        Find an element of the document by id. The index is built on
+        first use, so documents without clones never pay for it.
+        """
+        if self.id_index is None:
+            self.id_index = {}
+
+            for element in self.svg.iter():
+                key = element.get('id')
+
+                if key is not None and key not in self.id_index:
+                    self.id_index[key] = element
+
+        return self.id_index.get(element_id)
 
     def parseLengthWithUnits(self, attr):
         """ 
@@ -337,97 +516,513 @@ class SvgParser(object):
         """
         Parse the SVG data into entities.
         """
+        self.entities = list(self.iter_entities())
+
+    def get_document_transform(self):
+        """
+        Get the transform from document coordinates to output coordinates.
+        """
         width = self.getLength('width', 100)
         height = self.getLength('height', 80)
 
-        self.recursivelyTraverseSvg(
-            self.svg,
-            [
-                [self.scale, 0.0, 0],
-                [0.0, -self.scale, height]
-            ])
+        return (self.scale, 0.0, 0.0, -self.scale, 0, height)
 
-    def recursivelyTraverseSvg(self, nodeList, current_transform=[[1.0, 0.0, 0.0], [0.0, -1.0, 0.0]], parent_visibility='visible'):
+    def iter_entities(self):
         """
-        Recursively traverse the svg file to plot out all of the
-        paths. The function keeps track of the composite transformation
-        that should be applied to each path.
+        Parse the SVG data, yielding entities as the document is traversed
+        instead of collecting them.
+        """
+        return self.finish_entities(self.traverseSvg(self.svg, self.get_document_transform()))
+
+    def iterparse_entities(self, stream):
+        """
+        Parse the SVG data from a file or stream with lxml's iterparse,
+        yielding entities as they are read. Only the elements being
+        traversed and those referenced by <use> are kept in memory.
+        """
+        return self.finish_entities(self.traverseStream(stream))
+
+    def finish_entities(self, entities):
+        """
+        Make sure entities are flattened by the time they are yielded.
+        """
+        if self.stats is not None:
+            entities = self.stats.iterate('traverse', entities)
+
+        if self.flatten_backend == 'numpy' or self.jobs > 1:
+            return self.flatten_batches(entities)
+
+        return entities
+
+    def flatten_batches(self, entities):
+        """
+        Hold back entities until batch_size paths are waiting to be
+        flattened, then flatten them together and yield them in order.
+        """
+        buffered = []
+
+        try:
+            for entity in entities:
+                buffered.append(entity)
+
+                if len(self.unflattened) + len(self.unparsed) >= self.batch_size:
+                    self.flatten_paths()
+
+                    for entity in buffered:
+                        yield entity
+
+                    buffered = []
+
+            self.flatten_paths()
+        finally:
+            self.close_pool()
+
+        for entity in buffered:
+            yield entity
+
+    def flatten_paths(self):
+        """
+        Flatten all paths that were deferred for batch flattening.
+        """
+        if self.stats is not None:
+            self.stats.start('flatten')
+
+        if self.unparsed:
+            self.parse_paths()
+
+        if self.unflattened:
+            paths = [entity.cubic_path for entity in self.unflattened]
+
+            for entity, segments in zip(self.unflattened, flatten.flatten_batch(paths, self.flat)):
+                entity.segments = Polylines(segments)
+                entity.cubic_path = None
+
+            self.unflattened = []
+
+        for key, entity in self.unstored:
+            self.fragment_cache.put(key, entity.segments)
+
+        self.unstored = []
+
+        if self.stats is not None:
+            self.stats.stop()
+
+    def parse_paths(self):
+        """
+        Parse and flatten the paths deferred to the process pool. They are
+        split into contiguous chunks of about the same amount of path
+        data, so results come back in document order.
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.jobs)
+
+        total = sum(len(d) for _, d, _ in self.unparsed)
+        target = max(total // (self.jobs * self.chunks_per_job), 1)
+
+        chunks = []
+        chunk = []
+        cost = 0
+
+        for _, d, node_transform in self.unparsed:
+            chunk.append((d, node_transform))
+            cost += len(d)
+
+            if cost >= target:
+                chunks.append((chunk, self.flat, self.flatten_backend, self.stats is not None))
+                chunk = []
+                cost = 0
+
+        if chunk:
+            chunks.append((chunk, self.flat, self.flatten_backend, self.stats is not None))
+
+        results = []
+
+        for segments, counts in self.pool.map(flatten_path_chunk, chunks):
+            results.extend(segments)
+
+            if counts is not None:
+                self.stats.merge(counts)
+
+        for (entity, _, _), segments in zip(self.unparsed, results):
+            entity.segments = segments
+
+        self.unparsed = []
+
+    def close_pool(self):
+        """
+        Stop the worker processes, if any were started.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def get_node_state(self, node, current_transform, parent_visibility):
+        """
+        Get the visibility and composite transform of a node.
+        """
+        # Ignore invisible nodes
+        node_visibility = node.get('visibility', parent_visibility)
+
+        if node_visibility == 'inherit':
+            node_visibility = parent_visibility
+
+        if node_visibility == 'hidden' or node_visibility == 'collapse':
+            pass
+
+        # Apply the current matrix transform to this node's transform
+        node_transform = transform.compose(current_transform, transform.parse(node.get('transform'), self.parsed_transforms))
+
+        return node_transform, node_visibility
+
+    def get_use_state(self, node, node_transform, node_visibility):
+        """
+        Get the element referenced by a <use> node (or None), and the
+        transform and visibility to draw it with.
+        """
+        refid = node.get(SvgParser.href_attribute)
+
+        if not refid:
+            return None, None, None
+
+        x = float(node.get('x', '0'))
+        y = float(node.get('y', '0'))
+        
+        if (x != 0) or (y != 0):
+            node_transform = transform.compose(node_transform, transform.parse('translate(%f,%f)' % (x, y), self.parsed_transforms))
+        
+        # TODO: this looks unnecessary
+        node_visibility = node.get('visibility', node_visibility)
+
+        # [1:] to ignore leading '#' in reference
+        return refid[1:], node_transform, node_visibility
+
+    def traverseSvg(self, nodeList, current_transform=(1.0, 0.0, 0.0, -1.0, 0.0, 0.0), parent_visibility='visible', expanding=()):
+        """
+        Traverse the svg file to plot out all of the paths, yielding an
+        entity for each. The function keeps track of the composite
+        transformation that should be applied to each path.
 
         This function handles path, group, line, rect, polyline, polygon,
         circle, ellipse and use (clone) elements. Notable elements not
         handled include text. Unhandled elements should be converted to
         paths in Inkscape.
+
+        Groups and clones are followed with an explicit stack rather than
+        recursion, so deeply nested documents do not hit the recursion
+        limit. The ids of the groups and clones being expanded, starting
+        with [expanding], are counted so that a <use> of one of them (a
+        cycle) is skipped instead of followed forever.
         """
-        for node in nodeList:
-            # Ignore invisible nodes
-            node_visibility = node.get('visibility', parent_visibility)
+        stack = [(iter(nodeList), current_transform, parent_visibility, None)]
+        active = {}
+
+        for element_id in expanding:
+            active[element_id] = active.get(element_id, 0) + 1
+
+        while stack:
+            nodes, current_transform, parent_visibility, _ = stack[-1]
+            node = next(nodes, None)
+
+            if node is None:
+                element_id = stack.pop()[3]
+
+                if element_id is not None:
+                    active[element_id] -= 1
 
-            if node_visibility == 'inherit':
-                node_visibility = parent_visibility
+                continue
 
-            if node_visibility == 'hidden' or node_visibility == 'collapse':
-                pass
+            if not isinstance(node.tag, basestring):
+                continue
 
-            # Apply the current matrix transform to this node's transform
-            node_transform = simpletransform.composeTransform(current_transform, simpletransform.parseTransform(node.get('transform')))
+            if self.stats is not None:
+                self.stats.count('nodes')
+
+            node_transform, node_visibility = self.get_node_state(node, current_transform, parent_visibility)
 
             # Root and group tags
-            if node.tag == inkex.addNS('g', 'svg') or node.tag == 'g':
-                if (node.get(inkex.addNS('groupmode', 'inkscape')) == 'layer'):
-                    layer_name = node.get(inkex.addNS('label', 'inkscape'))
+            if node.tag in SvgParser.group_tags:
+                if (node.get(SvgParser.groupmode_attribute) == 'layer'):
+                    layer_name = node.get(SvgParser.label_attribute)
                     
-                    self.entities.append(SvgLayerChange(layer_name))
-                
-                self.recursivelyTraverseSvg(node, node_transform, parent_visibility=node_visibility)
+                    yield SvgLayerChange(layer_name)
+
+                element_id = node.get('id')
+
+                if element_id is not None:
+                    active[element_id] = active.get(element_id, 0) + 1
+
+                stack.append((iter(node), node_transform, node_visibility, element_id))
             # Use tags
-            elif node.tag == inkex.addNS('use', 'svg') or node.tag == 'use':
-                refid = node.get(inkex.addNS('href', 'xlink'))
-                
-                if refid:
-                    # [1:] to ignore leading '#' in reference
-                    path = '//*[@id="%s"]' % refid[1:]
-                    refnode = node.xpath(path)
+            elif node.tag in SvgParser.use_tags:
+                refid, use_transform, use_visibility = self.get_use_state(node, node_transform, node_visibility)
+
+                if refid is not None and active.get(refid):
+                    self.warn('Warning: unable to draw clone of %s inside itself.' % refid)
+                elif refid is not None:
+                    refnode = self.get_element_by_id(refid)
                     
-                    if refnode:
-                        x = float(node.get('x', '0'))
-                        y = float(node.get('y', '0'))
-                        
-                        if (x != 0) or (y != 0):
-                            node_transform = simpletransform.composeTransform(node_transform, simpletransform.parseTransform('translate(%f,%f)' % (x, y)))
-                        
-                        # TODO: this looks unnecessary
-                        node_visibility = node.get('visibility', node_visibility)
-
-                        self.recursivelyTraverseSvg(refnode, node_transform, parent_visibility=node_visibility)
-            elif not isinstance(node.tag, basestring):
-                pass
+                    if refnode is not None:
+                        active[refid] = active.get(refid, 0) + 1
+                        stack.append((iter([refnode]), use_transform, use_visibility, refid))
+                    elif self.pending_uses is not None:
+                        # Streaming: draw it once the element has been read
+                        ancestors = [element_id for element_id, count in active.items() if count]
+                        self.pending_uses.setdefault(refid, []).append((use_transform, use_visibility, ancestors))
             # Entity tags
             else:
                 entity = self.make_entity(node, node_transform)
                 
                 if entity == None:
-                    inkex.errormsg('Warning: unable to draw object, please convert it to a path first.')
+                    self.warn('Warning: unable to draw object, please convert it to a path first.')
+                else:
+                    yield entity
+
+    def scan_references(self, stream):
+        """
+        Collect the ids referenced by <use> elements in a stream, and
+        rewind it. Elements are cleared as they are read, so the scan
+        does not build the document.
+        """
+        position = stream.tell()
+        references = set()
+
+        for _, node in etree.iterparse(stream, events=('end',), huge_tree=True):
+            if node.tag in SvgParser.use_tags:
+                refid = node.get(SvgParser.href_attribute)
+
+                if refid:
+                    references.add(refid[1:])
+
+            node.clear()
+
+            parent = node.getparent()
+
+            if parent is not None:
+                while node.getprevious() is not None:
+                    del parent[0]
+
+        stream.seek(position)
+
+        return references
+
+    def traverseStream(self, stream):
+        """
+        Same as traverseSvg, but reads the document incrementally with
+        iterparse and clears elements once they have been processed, so
+        memory use does not grow with the size of the document.
+
+        Elements referenced by <use> are found with a first pass over the
+        stream (spooled to a temporary file if it cannot be rewound) and
+        kept. A <use> that refers to an element further down the document
+        is drawn once that element has been read. As in traverseSvg, a
+        <use> of an element it is inside of is skipped.
+        """
+        try:
+            stream.seek(stream.tell())
+        except (AttributeError, IOError):
+            spool = tempfile.TemporaryFile()
+            shutil.copyfileobj(stream, spool)
+            spool.seek(0)
+            stream = spool
+
+        references = self.scan_references(stream)
+        pending = self.pending_uses = {}
+        stack = []
+        # Number of open groups with each id
+        active = {}
+        skipping = 0
+        keeping = 0
+
+        self.id_index = {}
+
+        for event, node in etree.iterparse(stream, events=('start', 'end'), huge_tree=True):
+            node_id = node.get('id')
+            referenced = node_id in references
+
+            if event == 'start':
+                if referenced:
+                    keeping += 1
+
+                if skipping:
+                    skipping += 1
+                    continue
+
+                if self.stats is not None:
+                    self.stats.count('nodes')
+
+                if not stack:
+                    # Root <svg> element
+                    self.svg = node
+                    stack.append((self.get_document_transform(), 'visible', None))
+                    continue
+
+                current_transform, parent_visibility, _ = stack[-1]
+                node_transform, node_visibility = self.get_node_state(node, current_transform, parent_visibility)
+
+                if node.tag in SvgParser.group_tags:
+                    if (node.get(SvgParser.groupmode_attribute) == 'layer'):
+                        yield SvgLayerChange(node.get(SvgParser.label_attribute))
+
+                    if node_id is not None:
+                        active[node_id] = active.get(node_id, 0) + 1
+
+                    stack.append((node_transform, node_visibility, node_id))
+                    continue
+
+                skipping = 1
+
+                if node.tag in SvgParser.use_tags:
+                    refid, use_transform, use_visibility = self.get_use_state(node, node_transform, node_visibility)
+
+                    if refid is None:
+                        continue
+
+                    ancestors = [element_id for element_id, count in active.items() if count]
+
+                    if refid in ancestors:
+                        self.warn('Warning: unable to draw clone of %s inside itself.' % refid)
+                        continue
+
+                    refnode = self.id_index.get(refid)
+
+                    if refnode is None:
+                        pending.setdefault(refid, []).append((use_transform, use_visibility, ancestors))
+                    else:
+                        for entity in self.traverseSvg([refnode], use_transform, use_visibility, ancestors + [refid]):
+                            yield entity
+                else:
+                    entity = self.make_entity(node, node_transform)
+
+                    if entity == None:
+                        self.warn('Warning: unable to draw object, please convert it to a path first.')
+                    else:
+                        yield entity
+            else:
+                if skipping:
+                    skipping -= 1
+                else:
+                    element_id = stack.pop()[2]
+
+                    if element_id is not None:
+                        active[element_id] -= 1
+
+                if referenced:
+                    keeping -= 1
+
+                    if node_id not in self.id_index:
+                        refnode = self.id_index[node_id] = copy.deepcopy(node)
+
+                        for use_transform, use_visibility, ancestors in pending.pop(node_id, []):
+                            if node_id in ancestors:
+                                self.warn('Warning: unable to draw clone of %s inside itself.' % node_id)
+                                continue
+
+                            for entity in self.traverseSvg([refnode], use_transform, use_visibility, ancestors + [node_id]):
+                                yield entity
+
+                # Children of a referenced element are needed until it ends
+                if keeping:
+                    continue
+
+                node.clear()
+
+                parent = node.getparent()
+
+                if parent is not None:
+                    while node.getprevious() is not None:
+                        del parent[0]
+
+        for refid in sorted(pending):
+            self.warn('Warning: unable to draw clone, no element has the id %s.' % refid)
+
+        self.pending_uses = None
 
     def make_entity(self, node, node_transform):
         """
         Construct an appropriate entity for this SVG node.
         """
-        for nodetype in SvgParser.entity_map.keys():
-            tag = nodetype
-            ns = 'svg'
-            
-            if type(tag) is tuple:
-                tag = nodetype[0]
-                ns = nodetype[1]
-            
-            if node.tag == inkex.addNS(tag, ns) or node.tag == tag:
-                cls = SvgParser.entity_map[nodetype]
+        cls = self.tag_map.get(node.tag)
 
-                entity = cls(node, node_transform)
-                self.entities.append(entity)
-                
-                return entity
-        
-        return None
+        if cls is None:
+            return None
+
+        if self.stats is not None:
+            self.stats.count('elements.' + node.tag.rpartition('}')[2])
+            self.stats.start('entities')
+
+            entity = self.make_cached_entity(cls, node, node_transform)
+
+            self.stats.stop()
+
+            return entity
+
+        return self.make_cached_entity(cls, node, node_transform)
+
+    def make_cached_entity(self, cls, node, node_transform):
+        """
+        Construct the entity of class [cls] for this SVG node, from the
+        fragment cache if there is one.
+        """
+        if self.fragment_cache is None or not issubclass(cls, SvgPath):
+            return self.build_entity(cls, node, node_transform)
+
+        key = self.fragment_cache.make_key(node, node_transform, self.flat, self.flatten_backend)
+        segments = self.fragment_cache.get(key)
+
+        if segments is not None:
+            return SvgPath.from_geometry(None, segments)
+
+        entity = self.build_entity(cls, node, node_transform)
+
+        if self.unflattened or self.unparsed:
+            # Stored by flatten_paths()
+            self.unstored.append((key, entity))
+        else:
+            self.fragment_cache.put(key, entity.segments)
+
+        return entity
+
+    def build_entity(self, cls, node, node_transform):
+        """
+        Construct an entity of class [cls] for this SVG node, flattened
+        now or deferred for batch flattening.
+        """
+        entity = None
+
+        if cls is SvgPath and self.geometry_cache is not None:
+            entity = self.geometry_cache.make_path(cls, node, node_transform, self.flat, self.flatten_backend)
+
+        if entity is None and cls is SvgPath and self.jobs > 1 and node.get('d'):
+            # Filled in by parse_paths()
+            entity = cls.from_geometry(None)
+            self.unparsed.append((entity, node.get('d'), node_transform))
+
+            return entity
+
+        if entity is None and cls is SvgPath and self.flatten_backend == 'python':
+            # Parsed and flattened in one pass
+            return cls.from_path_data(node.get('d'), node_transform, self.flat, self.stats)
+
+        if cls is SvgText:
+            self.warn('Warning: unable to draw text. please convert it to a path first.')
+
+        if entity is None:
+            entity = cls(node, node_transform)
+
+        if isinstance(entity, SvgPath) and entity.cubic_path is not None:
+            if self.stats is not None:
+                self.stats.count('curves', flatten.count_curves(entity.cubic_path))
+
+            if self.flatten_backend == 'numpy' and entity.cubic_path:
+                self.unflattened.append(entity)
+            elif self.stats is not None:
+                self.stats.start('flatten')
+                entity.flatten(self.flat)
+                self.stats.stop()
+            else:
+                entity.flatten(self.flat)
+
+        return entity
 
 
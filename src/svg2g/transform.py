@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+from array import array
+
+from lib import simpletransform
+
+from svg2g.geometry import Polylines
+
+# Affine transforms are immutable 6-tuples (a, b, c, d, e, f), in the
+# order of SVG's matrix(), mapping (x, y) to (a*x + c*y + e, b*x + d*y + f).
+# The arithmetic below is done in the same order as simpletransform's,
+# so results are the same to the bit.
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# Size at which a memo of parsed transform attributes is cleared
+max_parsed = 10000
+
+def from_matrix(mat):
+    """
+    Convert a simpletransform [[a, c, e], [b, d, f]] matrix.
+    """
+    ((a, c, e), (b, d, f)) = mat
+
+    return (a, b, c, d, e, f)
+
+def to_matrix(m):
+    """
+    Convert to a simpletransform [[a, c, e], [b, d, f]] matrix.
+    """
+    a, b, c, d, e, f = m
+
+    return [[a, c, e], [b, d, f]]
+
+def parse(text, parsed=None):
+    """
+    Parse a transform attribute. Anything equivalent to no transform is
+    IDENTITY itself. If [parsed] is given, it is a dict memoizing the
+    results, so that each distinct string is parsed once; it is cleared
+    when it holds max_parsed entries.
+    """
+    if not text:
+        return IDENTITY
+
+    if parsed is None:
+        parsed = {}
+
+    m = parsed.get(text)
+
+    if m is None:
+        m = from_matrix(simpletransform.parseTransform(text))
+
+        if m == IDENTITY:
+            m = IDENTITY
+
+        if len(parsed) >= max_parsed:
+            parsed.clear()
+
+        parsed[text] = m
+
+    return m
+
+def compose(m1, m2):
+    """
+    Return the transform applying [m2], then [m1].
+    """
+    if m2 is IDENTITY:
+        return m1
+
+    if m1 is IDENTITY:
+        return m2
+
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+
+    return (
+        a1 * a2 + c1 * b2,
+        b1 * a2 + d1 * b2,
+        a1 * c2 + c1 * d2,
+        b1 * c2 + d1 * d2,
+        a1 * e2 + c1 * f2 + e1,
+        b1 * e2 + d1 * f2 + f1
+    )
+
+def apply_to_path(m, path):
+    """
+    Transform a CubicSuperPath in place.
+    """
+    if m is IDENTITY:
+        return
+
+    a, b, c, d, e, f = m
+
+    for subpath in path:
+        for superpoint in subpath:
+            for point in superpoint:
+                x, y = point
+                point[0] = a * x + c * y + e
+                point[1] = b * x + d * y + f
+
+def apply_to_points(m, points):
+    """
+    Return a list of (x, y) points transformed.
+    """
+    a, b, c, d, e, f = m
+
+    return [(a * x + c * y + e, b * x + d * y + f) for x, y in points]
+
+def apply_to_coordinates(m, coordinates):
+    """
+    Return a flat array of x, y coordinates transformed.
+    """
+    if m is IDENTITY:
+        return array('d', coordinates)
+
+    a, b, c, d, e, f = m
+
+    xs = coordinates[0::2]
+    ys = coordinates[1::2]
+
+    result = array('d', coordinates)
+    result[0::2] = array('d', [a * x + c * y + e for x, y in zip(xs, ys)])
+    result[1::2] = array('d', [b * x + d * y + f for x, y in zip(xs, ys)])
+
+    return result
+
+def apply_to_polylines(m, polylines):
+    """
+    Return a Polylines buffer transformed, in one pass over its
+    coordinates.
+    """
+    if m is IDENTITY:
+        return polylines
+
+    result = Polylines()
+    result.coordinates = apply_to_coordinates(m, polylines.coordinates)
+    result.offsets = array(polylines.offsets.typecode, polylines.offsets)
+
+    return result
@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+
+import sys
+
+from svg2g.batch import Svg2GBatch
+
+if __name__ == '__main__':
+    batch = Svg2GBatch()
+    sys.exit(1 if batch.run() else 0)
@@ -7,5 +7,7 @@ scaling=0.2646 # 96dpi scaling
 marginX=$3
 paperLength=$4
 #echo $4
+# Set SVG2G_SERVER to the socket of a running "svg2g.py serve" to convert through it
+server=${SVG2G_SERVER:+--server=$SVG2G_SERVER}
 # Distance between the blade cutter and the pen is 94mm so a 64mm xoffset = margin of 30mm
-$SVG2G --scaling=$scaling --start-delay=100 --stop-delay=100 --xy-feedrate=3000 --y-home=103 --z-home=125 --xoffset=$3 --paper-length=$4 $1 > $2
+$SVG2G $server --scaling=$scaling --start-delay=100 --stop-delay=100 --xy-feedrate=3000 --y-home=103 --z-home=125 --xoffset=$3 --paper-length=$4 $1 > $2
@@ -0,0 +1,78 @@
+import math
+
+import pytest
+
+from svg2g import api
+from svg2g import flatten
+from svg2g.gcode import GCodeBuilder
+from svg2g.options import Options
+from svg2g.svg import SvgPath
+
+D = 'M 10 10 C 20 40 60 40 70 10 S 100 -20 120 10 Q 130 30 140 10 a 5 3 20 0 1 10 10 Z'
+
+TRANSFORMS = ['', 'rotate(30)', 'scale(1.7)', 'translate(5,5)', 'scale(1.7)', 'matrix(1,0.3,0,1,0,0)', 'rotate(30)']
+
+def make_document(transforms):
+    paths = ''.join('<path d="%s" transform="%s"/>' % (D, t) for t in transforms)
+
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="200" height="150">%s</svg>' % paths).encode('utf-8')
+
+def get_polylines(source, **options):
+    converter = api.Converter(Options(scaling=0.2646, **options))
+
+    return [[list(polyline) for polyline in entity.segments] for entity in converter.iter_entities(source) if isinstance(entity, SvgPath)]
+
+def distance_to_polyline(point, polyline):
+    px, py = point
+    best = float('inf')
+
+    for (ax, ay), (bx, by) in zip(polyline, polyline[1:]):
+        dx = bx - ax
+        dy = by - ay
+        length2 = dx * dx + dy * dy
+        t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+        best = min(best, math.hypot(px - ax - t * dx, py - ay - t * dy))
+
+    return best
+
+def test_output_does_not_depend_on_instance_order():
+    forwards = get_polylines(make_document(TRANSFORMS))
+    backwards = get_polylines(make_document(TRANSFORMS[::-1]))
+
+    assert forwards == backwards[::-1]
+
+def test_output_does_not_depend_on_earlier_conversions():
+    converter = api.Converter(Options(scaling=0.2646))
+    source = make_document(TRANSFORMS)
+
+    # The same path at nearby scales, in the converter's geometry cache
+    b''.join(converter.convert(make_document(['scale(1.05)', 'scale(0.9)', 'scale(1.05)'])))
+
+    warm = b''.join(converter.convert(source))
+    cold = b''.join(api.Converter(Options(scaling=0.2646)).convert(source))
+
+    assert warm == cold
+
+def test_cache_on_and_off_agree_within_tolerance():
+    source = make_document(TRANSFORMS)
+    cached = get_polylines(source)
+    uncached = get_polylines(source, geometry_cache=0)
+    flat = GCodeBuilder.resolution
+
+    assert len(cached) == len(uncached)
+
+    for cached_entity, uncached_entity in zip(cached, uncached):
+        assert len(cached_entity) == len(uncached_entity)
+
+        for cached_polyline, uncached_polyline in zip(cached_entity, uncached_entity):
+            for end in (0, -1):
+                assert cached_polyline[end] == pytest.approx(uncached_polyline[end], abs=1e-9)
+
+            for point in cached_polyline:
+                assert distance_to_polyline(point, uncached_polyline) <= 2 * flat
+
+@pytest.mark.skipif(flatten.numpy is None, reason='NumPy is not available')
+def test_numpy_output_is_the_same_with_the_cache_off():
+    source = make_document(TRANSFORMS)
+
+    assert get_polylines(source, flatten_backend='numpy') == get_polylines(source, flatten_backend='numpy', geometry_cache=0)
@@ -0,0 +1,45 @@
+import io
+import os
+
+import pytest
+
+from svg2g import api
+from svg2g import flatten
+from svg2g.cache import FragmentCache
+from svg2g.options import Options
+
+D = 'M 10 10 C 20 40 60 40 70 10 S 100 -20 120 10 Q 130 30 140 10 a 5 3 20 0 1 10 10 Z'
+
+BACKENDS = ['python'] + (['numpy'] if flatten.numpy is not None else [])
+
+def make_document(transforms):
+    paths = ''.join('<path d="%s" transform="%s"/>' % (D, t) for t in transforms)
+    clones = '<use xlink:href="#p0"/><use xlink:href="#p0" transform="rotate(30)"/>'
+
+    return ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="200" height="150">'
+        '<path id="p0" d="%s"/>%s%s</svg>' % (D, paths, clones)).encode('utf-8')
+
+def convert(source, backend, fragment_cache=None, messages=None):
+    converter = api.Converter(Options(scaling=0.2646, flatten_backend=backend))
+
+    return b''.join(converter.convert(source, fragment_cache, messages=messages))
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_incremental_runs_match_a_full_conversion(tmpdir, backend):
+    path = os.path.join(str(tmpdir), 'fragments.pickle')
+    source = make_document(['rotate(30)', 'scale(1.7)', 'rotate(30)'])
+    full = convert(source, backend)
+
+    assert convert(source, backend, FragmentCache(path)) == full
+    assert convert(source, backend, FragmentCache(path)) == full
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_incremental_run_after_an_edit_matches_a_full_conversion(tmpdir, backend):
+    path = os.path.join(str(tmpdir), 'fragments.pickle')
+    convert(make_document(['rotate(30)', 'scale(1.7)', 'rotate(30)']), backend, FragmentCache(path))
+
+    edited = make_document(['rotate(30)', 'scale(0.6)', 'rotate(75) scale(2.5)'])
+    messages = io.BytesIO()
+
+    assert convert(edited, backend, FragmentCache(path), messages) == convert(edited, backend)
+    assert b'Reused 4 of 6 flattened elements.' in messages.getvalue()
@@ -0,0 +1,37 @@
+import pytest
+
+from svg2g.options import Options
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True),
+    (False, False),
+    ('true', True),
+    ('false', False),
+    ('True', True),
+    ('FALSE', False),
+    ('1', True),
+    ('0', False),
+    (u'false', False)
+])
+def test_boolean_options(value, expected):
+    options = Options(compact=value, optimize_travel=value)
+
+    assert options.compact is expected
+    assert options.optimize_travel is expected
+
+@pytest.mark.parametrize('value', ['yes', '', 'off', 1, 0])
+def test_invalid_boolean_options_are_an_error(value):
+    with pytest.raises(ValueError):
+        Options(compact=value)
+
+def test_defaults_and_conversion():
+    options = Options(scaling='0.5', jobs='4')
+
+    assert options.scaling == 0.5
+    assert options.jobs == 4
+    assert options.compact is False
+    assert options.flatten_backend == 'python'
+
+def test_unknown_options_are_an_error():
+    with pytest.raises(TypeError):
+        Options(compcat=True)
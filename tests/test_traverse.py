@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+from svg2g import api
+from svg2g.options import Options
+from svg2g.svg import SvgPath
+
+def make_document(body):
+    return ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="200" height="150">'
+        '%s</svg>' % body).encode('utf-8')
+
+def count_paths(source, stream_xml):
+    messages = io.BytesIO()
+    converter = api.Converter(Options(scaling=0.2646, stream_xml=stream_xml))
+    count = len([entity for entity in converter.iter_entities(source, messages=messages) if isinstance(entity, SvgPath)])
+
+    return count, messages.getvalue()
+
+@pytest.mark.parametrize('stream_xml', [False, True])
+def test_use_of_an_enclosing_group_is_skipped(stream_xml):
+    source = make_document('<g id="g1"><path d="M 0 0 L 10 10"/><use xlink:href="#g1"/></g>')
+    count, messages = count_paths(source, stream_xml)
+
+    assert count == 1
+    assert b'unable to draw clone of g1 inside itself' in messages
+
+@pytest.mark.parametrize('stream_xml', [False, True])
+def test_mutually_referring_groups_are_drawn_once_each(stream_xml):
+    source = make_document(
+        '<g id="a"><path d="M 0 0 L 10 10"/><use xlink:href="#b"/></g>'
+        '<g id="b"><path d="M 0 10 L 10 0"/><use xlink:href="#a"/></g>')
+    count, messages = count_paths(source, stream_xml)
+
+    # a, the clone of b inside a, b and the clone of a inside b
+    assert count == 4
+    assert b'inside itself' in messages
+
+@pytest.mark.parametrize('stream_xml', [False, True])
+def test_chain_of_clones_ending_in_a_cycle_terminates(stream_xml):
+    source = make_document(
+        '<use id="u1" xlink:href="#u2"/><use id="u2" xlink:href="#g1"/>'
+        '<g id="g1"><path d="M 0 0 L 10 10"/><use xlink:href="#u1"/></g>')
+    count, messages = count_paths(source, stream_xml)
+
+    assert count > 0
+    assert b'inside itself' in messages
+
+@pytest.mark.parametrize('stream_xml', [False, True])
+def test_repeated_clones_are_not_cycles(stream_xml):
+    source = make_document(
+        '<path id="p" d="M 0 0 L 10 10"/>'
+        '<g id="g1"><use xlink:href="#p"/><use xlink:href="#p"/></g><use xlink:href="#g1"/>')
+    count, messages = count_paths(source, stream_xml)
+
+    assert count == 5
+    assert b'inside itself' not in messages